@@ -7,6 +7,7 @@ import numpy as np
 import pickle
 
 from src.util import geometry
+from src.util.pose_index import PoseIndex
 
 processed_path = os.path.abspath("/work/qvpr/data/processed/RobotCar/")
 csv_path = "/work/qvpr/workspace/RobotCar/examples/"
@@ -17,25 +18,12 @@ def build_reference_keyframes(gt, threshold, attitude_weight):
     a traverse, where each timestamp corresponds to a camera pose that 
     has regular spatial separation (threshold) from the previous entry.
     """
-    indices = [0] # first image in set of keyframes
-    gt_curr = gt[0]
-    for i in range(1, len(gt)):
-        curr_diff = geometry.metric(gt_curr, gt[i], attitude_weight)
-        if curr_diff > threshold:
-            indices.append(i)
-            gt_curr = gt[i]
-    indices = np.asarray(indices)
-    return indices
+    return geometry.keyframe_indices(gt, attitude_weight, threshold)
 
 # for each query, cycle through reference and extract nearest query frame in pose
 def correspondences(ref, query, attitude_weight):
-    ind_q = []
-    for T in ref:
-        d = geometry.metric(T, query, attitude_weight)
-        #print(T.t(), query[np.argmin(d)].t())
-        #print((T.R().inv() *  query[np.argmin(d)].R()).magnitude())
-        ind_q.append(np.argmin(d))
-    return np.asarray(ind_q)
+    ind_q, _ = PoseIndex(query, attitude_weight).nearest(ref)
+    return ind_q[:, 0]
 
 if __name__ == "__main__":
     """
@@ -5,9 +5,10 @@ import csv
 from tqdm.auto import tqdm
 
 import numpy as np
-import pandas as pd
 
 from src.util import geometry
+from src.util.pose_index import PoseIndex
+from src.util.camera_poses import load_camera_poses, COLUMNS
 
 processed_path = os.path.abspath("/work/qvpr/data/ready/RobotCar/")
 csv_path = "/work/qvpr/workspace/RobotCar/"
@@ -18,28 +19,14 @@ def build_reference_keyframes(gt, threshold, attitude_weight):
     a traverse, where each timestamp corresponds to a camera pose that 
     has regular spatial separation (threshold) from the previous entry.
     """
-    indices = [0] # first image in set of keyframes
-    gt_curr = gt[0]
-    for i in tqdm(range(1, len(gt))):
-        curr_diff = geometry.metric(gt_curr, gt[i], attitude_weight)
-        if curr_diff > threshold:
-            indices.append(i)
-            gt_curr = gt[i]
-    indices = np.asarray(indices)
-    return indices
+    return geometry.keyframe_indices(gt, attitude_weight, threshold)
 
 # for each query, cycle through reference and extract nearest query frame in pose
 def correspondences(ref, query, attitude_weight):
-    ind_q = []
-    for T in tqdm(ref):
-        d = geometry.metric(T, query, attitude_weight)
-        best_match = np.argmin(d)
-        if d[best_match] > 10:
-            tqdm.write(str(d[best_match]))
-        #print(T.t(), query[np.argmin(d)].t())
-        #print((T.R().inv() *  query[np.argmin(d)].R()).magnitude())
-        ind_q.append(best_match)
-    return np.asarray(ind_q)
+    ind_q, d = PoseIndex(query, attitude_weight).nearest(ref)
+    for dist in d[d[:, 0] > 10, 0]:
+        tqdm.write(str(dist))
+    return ind_q[:, 0]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate 1-to-1 correspondences between reference and query traverses")
@@ -52,10 +39,10 @@ if __name__ == "__main__":
     parser.add_argument('-k', '--kf-threshold', type=float, default=1, help="threshold on weighted pose distance to generate new keyframe")
     args = parser.parse_args()
 
-    base_camera_poses = pd.read_csv(os.path.join(processed_path, args.baseref, 'stereo', 'left', 'camera_poses.csv'), header=0)
-    base_coords = base_camera_poses.iloc[:, 2:].values
+    base_camera_poses = load_camera_poses(os.path.join(processed_path, args.baseref, 'stereo', 'left'))
+    base_coords = base_camera_poses[COLUMNS].values
     base_SE3 = geometry.SE3.from_xyzrpy(base_coords)
-    base_tstamps = base_camera_poses.iloc[:, 1].values
+    base_tstamps = base_camera_poses['timestamp'].values
 
     indices = build_reference_keyframes(base_SE3, args.kf_threshold, args.attitude_weight)
     base_tstamps_sub = base_tstamps[indices]
@@ -63,10 +50,10 @@ if __name__ == "__main__":
 
     all_tstamps = []
     for name in args.traverses:
-        traverse_camera_poses = pd.read_csv(os.path.join(processed_path, name, 'stereo', 'left', 'camera_poses.csv'), header=0)
-        traverse_coords = traverse_camera_poses.iloc[:, 2:].values
+        traverse_camera_poses = load_camera_poses(os.path.join(processed_path, name, 'stereo', 'left'))
+        traverse_coords = traverse_camera_poses[COLUMNS].values
         traverse_SE3 = geometry.SE3.from_xyzrpy(traverse_coords)
-        traverse_tstamps = traverse_camera_poses.iloc[:, 1].values
+        traverse_tstamps = traverse_camera_poses['timestamp'].values
 
         ind_t = correspondences(base_SE3, traverse_SE3, args.attitude_weight)
         all_tstamps.append(traverse_tstamps[ind_t])
@@ -3,28 +3,21 @@ import argparse
 import shutil
 
 import numpy as np
-import pandas as pd
 
 from src.settings import RAW_DIR, READY_DIR, camera_names
 from src.util import geometry
 from src.util.geometry import SE3
+from src.util.camera_poses import load_camera_poses
 
 
 def create_traverse(traverse, camera, w, thres):
     # import camera poses
     img_path = os.path.join(READY_DIR, traverse, camera)
-    df = pd.read_csv(os.path.join(img_path, "camera_poses.csv"))
+    df = load_camera_poses(img_path)
     xyzrpy = df[["northing", "easting", "down", "roll", "pitch", "yaw"]].to_numpy()
     poses = SE3.from_xyzrpy(xyzrpy)
     # generate subsampled traverse
-    indices = [0] # first image in set of keyframes
-    pose_curr = poses[0]
-    for i in range(1, len(poses)):
-        curr_diff = geometry.metric(pose_curr, poses[i], w)
-        if curr_diff > thres:
-            indices.append(i)
-            pose_curr = poses[i]
-    indices = np.asarray(indices)
+    indices = geometry.keyframe_indices(poses, w, thres)
     subsampled = df.iloc[indices]
     return subsampled
 
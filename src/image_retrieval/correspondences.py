@@ -0,0 +1,106 @@
+import os
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+from tqdm import tqdm
+
+from src.settings import READY_DIR
+from src.util import geometry
+from src.util import camera_poses
+from src.util.pose_index import PoseIndex
+
+# reference poses and match parameters of the worker processes, set by init_worker
+worker_args = None
+
+
+def load_poses(traverse, camera, ready_dir=READY_DIR):
+    """
+    Returns the image timestamps and camera poses (SE3) of a traverse.
+    """
+    return camera_poses.load_poses(os.path.join(ready_dir, traverse, camera))
+
+
+def match_poses(ref, query, w, k, t_tol, R_tol):
+    """
+    Matches every reference pose to the query poses. Returns a dict of
+        topk_indices, topk_distances (R x k): k nearest query poses under
+            geometry.metric with attitude weight w, nearest first
+        offsets (R + 1), indices, t_distances, R_distances: ragged arrays of
+            all query poses within t_tol (m) and R_tol (rad) of each reference
+            pose, the matches of reference i being
+            indices[offsets[i]:offsets[i + 1]]
+    """
+    index = PoseIndex(query, w)
+    topk_indices, topk_distances = index.nearest(ref, k)
+    offsets, indices, distances = index.within(ref, t_tol, R_tol)
+    return {"topk_indices": topk_indices, "topk_distances": topk_distances, "offsets": offsets,
+            "indices": indices, "t_distances": distances[:, 0], "R_distances": distances[:, 1]}
+
+
+def init_worker(ref, camera, w, k, t_tol, R_tol, ready_dir):
+    global worker_args
+    worker_args = (ref, camera, w, k, t_tol, R_tol, ready_dir)
+
+
+def match_traverse(traverse):
+    ref, camera, w, k, t_tol, R_tol, ready_dir = worker_args
+    tstamps, query = load_poses(traverse, camera, ready_dir)
+    result = match_poses(ref, query, w, k, t_tol, R_tol)
+    result["query_timestamps"] = tstamps
+    return traverse, result
+
+
+def match_traverses(ref, traverses, camera, w, k=1, t_tol=25, R_tol=np.pi, nWorkers=4, ready_dir=READY_DIR):
+    """
+    Matches the reference poses to the camera poses of each query traverse,
+    see match_poses. Query traverses are loaded and matched in parallel by a
+    pool of nWorkers processes. Returns a dict of query traverse name to
+    matches, which also hold the query image timestamps.
+    """
+    results = {}
+    nWorkers = max(min(nWorkers, len(traverses)), 1)
+    with Pool(nWorkers, initializer=init_worker, initargs=(ref, camera, w, k, t_tol, R_tol, ready_dir)) as pool:
+        for traverse, result in tqdm(pool.imap_unordered(match_traverse, traverses), total=len(traverses)):
+            results[traverse] = result
+    return results
+
+
+def save_correspondences(path, ref_tstamps, results):
+    """
+    Writes the matches of each query traverse to <path>/<query traverse>.npz
+    along with the reference and query image timestamps.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for traverse, result in results.items():
+        np.savez(os.path.join(path, traverse + ".npz"), ref_timestamps=ref_tstamps, **result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Match reference keyframes to query traverses, keeping the top-k matches and all matches within tolerance")
+    parser.add_argument("-r", "--reference", type=str, required=True,
+                        help="<Required> name of reference traverse to subsample into keyframes")
+    parser.add_argument("-q", "--queries", nargs="+", type=str, required=True,
+                        help="<Required> query traverses to retrieve correspondences from")
+    parser.add_argument("-c", "--camera", type=str, default="stereo/left", help="camera to match images of")
+    parser.add_argument("-w", "--attitude-weight", type=float, default=15,
+                        help="weight for attitude components d where 1 / d rad rotation is equivalent to 1m translation")
+    parser.add_argument("-k", "--kf-threshold", type=float, default=1,
+                        help="threshold on weighted pose distance to generate new reference keyframe")
+    parser.add_argument("--top-k", type=int, default=1, help="number of nearest query images kept per keyframe")
+    parser.add_argument("--t-tol", type=float, default=25,
+                        help="translation tolerance (m) for query images matching a keyframe")
+    parser.add_argument("--R-tol", type=float, default=180,
+                        help="rotation tolerance (deg) for query images matching a keyframe")
+    parser.add_argument("-n", "--nWorkers", type=int, default=4, help="Number of query traverses matched in parallel")
+    parser.add_argument("-p", "--path", type=str, required=True,
+                        help="<Required> output folder, one .npz file of matches per query traverse")
+    args = parser.parse_args()
+
+    ref_tstamps, ref = load_poses(args.reference, args.camera)
+    indices = geometry.keyframe_indices(ref, args.attitude_weight, args.kf_threshold)
+    results = match_traverses(ref[indices], args.queries, args.camera, args.attitude_weight, args.top_k,
+                              args.t_tol, np.radians(args.R_tol), args.nWorkers)
+    save_correspondences(args.path, ref_tstamps[indices], results)
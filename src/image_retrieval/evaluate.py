@@ -0,0 +1,193 @@
+import os
+import argparse
+
+import numpy as np
+
+from src.settings import READY_DIR
+from src.util import geometry
+from src.util.geometry import SE3
+from src.util.camera_poses import load_poses
+from src.image_retrieval.ground_truth import GroundTruth
+
+
+def _top_k_block(similarity, k):
+    # k most similar columns of each row, most similar first
+    ind = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(similarity, ind, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ind, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def top_k(similarity, k, block_size=1024):
+    """
+    Returns the (Q x k) indices of the k most similar database images of each
+    query, most similar first, and their similarities. The (Q x D) similarity
+    matrix is read block_size rows at a time, so it can be a np.memmap of a
+    matrix larger than memory.
+    """
+    k = min(k, similarity.shape[1])
+    predictions = np.empty((len(similarity), k), dtype=np.int64)
+    scores = np.empty((len(similarity), k), dtype=similarity.dtype)
+    for start in range(0, len(similarity), block_size):
+        block = np.asarray(similarity[start:start + block_size])
+        predictions[start:start + len(block)], scores[start:start + len(block)] = _top_k_block(block, k)
+    return predictions, scores
+
+
+def descriptor_top_k(query_desc, db_desc, k, block_size=1024):
+    """
+    As top_k with the similarity being the dot product of query and database
+    descriptors, computed block_size queries at a time without forming the
+    full similarity matrix.
+    """
+    k = min(k, len(db_desc))
+    predictions = np.empty((len(query_desc), k), dtype=np.int64)
+    scores = np.empty((len(query_desc), k), dtype=np.result_type(query_desc, db_desc))
+    for start in range(0, len(query_desc), block_size):
+        block = np.asarray(query_desc[start:start + block_size]) @ db_desc.T
+        predictions[start:start + len(block)], scores[start:start + len(block)] = _top_k_block(block, k)
+    return predictions, scores
+
+
+def match_predictions(predictions, positives, block_size=4096):
+    """
+    Looks up the predictions (Q x k indices, negative for none) in the (Q x D)
+    CSR positives matrix, returning a (Q x k) boolean array of correct
+    predictions. Each block of queries is matched with one binary search of
+    its flattened (query, database image) positive keys.
+    """
+    if not positives.has_sorted_indices:
+        positives = positives.sorted_indices()
+    n_cols = positives.shape[1]
+    correct = np.zeros(predictions.shape, dtype=bool)
+    for start in range(0, len(predictions), block_size):
+        stop = min(start + block_size, len(predictions))
+        indptr = positives.indptr[start:stop + 1]
+        rows = np.repeat(np.arange(start, stop, dtype=np.int64), np.diff(indptr))
+        keys = rows * n_cols + positives.indices[indptr[0]:indptr[-1]]
+        if len(keys) == 0:
+            continue
+        block = predictions[start:stop]
+        pred_keys = np.arange(start, stop, dtype=np.int64)[:, None] * n_cols + block
+        pos = np.minimum(np.searchsorted(keys, pred_keys), len(keys) - 1)
+        correct[start:stop] = (keys[pos] == pred_keys) & (block >= 0)
+    return correct
+
+
+def recall_at_n(correct, has_positive, ns):
+    """
+    Returns a dict of N to the fraction of queries with at least one positive
+    whose top N predictions hold a positive.
+    """
+    if max(ns) > correct.shape[1]:
+        raise ValueError("Recall@{} needs at least {} predictions per query, got {}".format(
+            max(ns), max(ns), correct.shape[1]))
+    first = np.where(correct.any(axis=1), correct.argmax(axis=1), correct.shape[1])[has_positive]
+    return {n: float(np.mean(first < n)) if len(first) else 0. for n in ns}
+
+
+def precision_recall(correct_top1, scores_top1, has_positive):
+    """
+    Precision-recall curve of accepting the top prediction of each query when
+    its similarity is at least a threshold, swept over all top similarities.
+    Recall is over the queries with at least one positive.
+    Returns:
+        precision, recall and thresholds, in order of decreasing threshold
+    """
+    order = np.argsort(-scores_top1, kind="stable")
+    tp = np.cumsum(correct_top1[order])
+    precision = tp / np.arange(1, len(order) + 1)
+    recall = tp / max(np.count_nonzero(has_positive), 1)
+    return precision, recall, scores_top1[order]
+
+
+def localisation_error(query_poses, db_poses, predictions):
+    """
+    Translation (m) and rotation (rad) error of each query pose (SE3) to the
+    pose of its top database prediction, NaN for queries without prediction.
+    """
+    t_err = np.full(len(predictions), np.nan)
+    R_err = np.full(len(predictions), np.nan)
+    found = predictions[:, 0] >= 0
+    if np.any(found):
+        t_found, R_found = geometry.error(SE3.from_data(query_poses.data[found], single=False),
+                                          SE3.from_data(db_poses.data[predictions[found, 0]], single=False))
+        t_err[found] = t_found
+        R_err[found] = R_found
+    return t_err, R_err
+
+
+def evaluate(predictions, positives, scores=None, ns=(1, 5, 10, 20), query_poses=None, db_poses=None,
+             block_size=4096):
+    """
+    Evaluates retrieval of the database images for each query.
+    Args:
+        predictions (Q x k) : database image indices, most similar first, see
+            top_k and descriptor_top_k
+        positives (Q x D CSR) : positive matches, see GroundTruth
+        scores (Q x k) : similarities of the predictions, for the
+            precision-recall curve
+        query_poses, db_poses (SE3) : poses of the images, for the
+            localisation error
+    Returns:
+        dict of recall@N, precision-recall curve and per-query localisation error
+    """
+    has_positive = np.diff(positives.indptr) > 0
+    correct = match_predictions(predictions, positives, block_size)
+    results = {"recall": recall_at_n(correct, has_positive, ns),
+               "correct": correct, "has_positive": has_positive}
+    if scores is not None:
+        results["precision"], results["pr_recall"], results["thresholds"] = \
+            precision_recall(correct[:, 0], scores[:, 0], has_positive)
+    if query_poses is not None and db_poses is not None:
+        results["t_err"], results["R_err"] = localisation_error(query_poses, db_poses, predictions)
+    return results
+
+
+def poses_at(traverse, camera, tstamps):
+    """
+    Returns the camera poses (SE3) of a traverse at image timestamps.
+    """
+    all_tstamps, poses = load_poses(os.path.join(READY_DIR, traverse, camera))
+    return poses[np.searchsorted(all_tstamps, tstamps)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate retrieval of reference images for query images against ground_truth.py output")
+    parser.add_argument("-g", "--ground-truth", type=str, required=True,
+                        help="<Required> ground truth folder of a reference and query traverse")
+    parser.add_argument("-s", "--similarity", type=str,
+                        help="(query x reference) similarity matrix .npy, ordered as the ground truth timestamps")
+    parser.add_argument("--predictions", type=str,
+                        help="(query x k) reference indices .npy, most similar first, instead of a similarity matrix")
+    parser.add_argument("--scores", type=str, help="(query x k) similarities .npy of the predictions")
+    parser.add_argument("-n", "--ns", nargs="+", type=int, default=[1, 5, 10, 20], help="values of N for recall@N")
+    parser.add_argument("-b", "--block-size", type=int, default=1024, help="queries processed at a time")
+    parser.add_argument("-o", "--output", type=str, help="optional .npz to save per-query results to")
+    args = parser.parse_args()
+
+    if (args.similarity is None) == (args.predictions is None):
+        parser.error("exactly one of --similarity and --predictions is required")
+    # ground truth is saved with reference rows, queries are rows here
+    gt = GroundTruth.load(args.ground_truth).transpose()
+    if args.similarity is not None:
+        predictions, scores = top_k(np.load(args.similarity, mmap_mode="r"), max(args.ns), args.block_size)
+    else:
+        predictions = np.load(args.predictions)
+        scores = np.load(args.scores) if args.scores is not None else None
+
+    query_poses = db_poses = None
+    if "camera" in gt.params:
+        query_poses = poses_at(gt.params["query"], gt.params["camera"], gt.row_timestamps)
+        db_poses = poses_at(gt.params["reference"], gt.params["camera"], gt.col_timestamps)
+    results = evaluate(predictions, gt.positives, scores, args.ns, query_poses, db_poses, args.block_size)
+
+    for n, recall in results["recall"].items():
+        print("Recall@{}: {:.4f}".format(n, recall))
+    if "t_err" in results:
+        print("Median localisation error: {:.2f}m {:.2f}deg".format(
+            np.nanmedian(results["t_err"]), np.degrees(np.nanmedian(results["R_err"]))))
+    if args.output is not None:
+        np.savez(args.output, predictions=predictions, **{key: value for key, value in results.items()
+                                                         if key != "recall"})
@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.settings import READY_DIR
+from src.util import geometry
+from src.util.camera_poses import load_poses
+from src.util.pose_index import PoseIndex
+
+MATRICES = ["positives", "exclusions"]
+
+
+class GroundTruth:
+    """
+    Sparse ground truth between the images of two traverses, rows being the
+    images of one traverse (e.g. reference) and columns of the other (e.g.
+    query). positives is a boolean CSR matrix of the image pairs matching in
+    place and orientation. exclusions is a boolean CSR matrix of all pairs too
+    close to be used as negatives, a superset of positives.
+
+    Saved as a folder of .npy files, the CSR index arrays of each matrix and
+    the row and column image timestamps, which are memory-mapped on load so
+    loading takes the same time however large the matrices are.
+    """
+
+    def __init__(self, positives, exclusions, row_timestamps, col_timestamps, params=None):
+        self.positives = positives
+        self.exclusions = exclusions
+        self.row_timestamps = row_timestamps
+        self.col_timestamps = col_timestamps
+        self.params = params or {}
+
+    @property
+    def shape(self):
+        return self.positives.shape
+
+    def transpose(self):
+        """
+        Returns the ground truth with rows and columns swapped.
+        """
+        return GroundTruth(self.positives.T.tocsr(), self.exclusions.T.tocsr(),
+                           self.col_timestamps, self.row_timestamps, self.params)
+
+    def save(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, "row_timestamps.npy"), self.row_timestamps)
+        np.save(os.path.join(path, "col_timestamps.npy"), self.col_timestamps)
+        # column indices as int32 where possible, matching scipy's own index dtype
+        index_dtype = np.int32 if self.shape[1] < 2 ** 31 else np.int64
+        for name in MATRICES:
+            matrix = getattr(self, name)
+            np.save(os.path.join(path, name + "_indptr.npy"), matrix.indptr.astype(np.int64))
+            np.save(os.path.join(path, name + "_indices.npy"), matrix.indices.astype(index_dtype))
+        with open(os.path.join(path, "ground_truth.json"), "w") as f:
+            json.dump(self.params, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        row_timestamps = np.load(os.path.join(path, "row_timestamps.npy"), mmap_mode="r")
+        col_timestamps = np.load(os.path.join(path, "col_timestamps.npy"), mmap_mode="r")
+        shape = (len(row_timestamps), len(col_timestamps))
+        matrices = []
+        for name in MATRICES:
+            indptr = np.load(os.path.join(path, name + "_indptr.npy"), mmap_mode="r")
+            indices = np.load(os.path.join(path, name + "_indices.npy"), mmap_mode="r")
+            matrices.append(csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=shape, copy=False))
+        with open(os.path.join(path, "ground_truth.json")) as f:
+            params = json.load(f)
+        return cls(matrices[0], matrices[1], row_timestamps, col_timestamps, params)
+
+
+def ground_truth(row_poses, col_poses, row_timestamps, col_timestamps, pos_t=25, pos_R=np.pi, neg_t=50):
+    """
+    Builds the sparse ground truth between two sets of poses (SE3). Pairs
+    within pos_t (m) and pos_R (rad) are positives, and pairs within neg_t
+    (m) in any orientation are excluded from negatives.
+    """
+    if neg_t < pos_t:
+        raise ValueError("Negative exclusion radius {} is smaller than positive radius {}".format(neg_t, pos_t))
+    index = PoseIndex(col_poses, 0)
+    shape = (len(row_poses), len(col_poses))
+    matrices = []
+    for t_tol, R_tol in [(pos_t, pos_R), (neg_t, np.pi)]:
+        offsets, indices, _ = index.within(row_poses, t_tol, R_tol)
+        matrices.append(csr_matrix((np.ones(len(indices), dtype=bool), indices, offsets), shape=shape))
+    params = {"pos_t": pos_t, "pos_R": pos_R, "neg_t": neg_t}
+    return GroundTruth(matrices[0], matrices[1], np.asarray(row_timestamps), np.asarray(col_timestamps), params)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build sparse positive and negative exclusion matrices between reference and query traverses")
+    parser.add_argument("-r", "--reference", type=str, required=True, help="<Required> name of reference traverse")
+    parser.add_argument("-q", "--queries", nargs="+", type=str, required=True,
+                        help="<Required> query traverses to build ground truth for")
+    parser.add_argument("-c", "--camera", type=str, default="stereo/left", help="camera to match images of")
+    parser.add_argument("-w", "--attitude-weight", type=float, default=15,
+                        help="weight for attitude components d where 1 / d rad rotation is equivalent to 1m translation")
+    parser.add_argument("-k", "--kf-threshold", type=float, default=None,
+                        help="threshold on weighted pose distance to subsample the reference into keyframes, "
+                             "all reference images if not given")
+    parser.add_argument("--pos-t", type=float, default=25, help="translation tolerance (m) of positive matches")
+    parser.add_argument("--pos-R", type=float, default=180, help="rotation tolerance (deg) of positive matches")
+    parser.add_argument("--neg-t", type=float, default=50,
+                        help="translation (m) within which images are excluded from negatives")
+    parser.add_argument("-p", "--path", type=str, required=True,
+                        help="<Required> output folder, one ground truth folder per query traverse")
+    args = parser.parse_args()
+
+    ref_tstamps, ref = load_poses(os.path.join(READY_DIR, args.reference, args.camera))
+    if args.kf_threshold is not None:
+        indices = geometry.keyframe_indices(ref, args.attitude_weight, args.kf_threshold)
+        ref_tstamps, ref = ref_tstamps[indices], ref[indices]
+    for query in args.queries:
+        query_tstamps, query_poses = load_poses(os.path.join(READY_DIR, query, args.camera))
+        gt = ground_truth(ref, query_poses, ref_tstamps, query_tstamps, args.pos_t, np.radians(args.pos_R),
+                          args.neg_t)
+        gt.params.update({"reference": args.reference, "query": query, "camera": args.camera})
+        gt.save(os.path.join(args.path, "{}_{}".format(args.reference, query)))
+        print("{} {}: {} positives, {} excluded from negatives".format(
+            args.reference, query, gt.positives.nnz, gt.exclusions.nnz))
@@ -4,45 +4,72 @@ import argparse
 import numpy as np
 import pickle
 from scipy.spatial.transform import Rotation
-import pandas as pd
 
 from src.settings import RAW_DIR, READY_DIR, camera_names
+from src.process_raw.tar_source import find_tars, tar_timestamps
+from src.process_raw.timestamps import find_timestamps_file, load_timestamps
 import src.thirdparty.robotcar_dataset_sdk as sdk
-from src.thirdparty.robotcar_dataset_sdk.python.interpolate_poses import interpolate_ins_poses
-from src.thirdparty.robotcar_dataset_sdk.python.transform import build_se3_transform, se3_to_components
+from src.thirdparty.robotcar_dataset_sdk.python.interpolate_poses import interpolate_ins_poses_array
+from src.thirdparty.robotcar_dataset_sdk.python.transform import build_se3_transform
+from src.util.camera_poses import save_camera_poses
 
 
-def assign_poses(traverse, camera):
+def load_extrinsics(extrinsics_dir, name):
+    with open(os.path.join(extrinsics_dir, '{}.txt'.format(name))) as extrinsics_file:
+        extrinsics = next(extrinsics_file)
+    return np.asarray(build_se3_transform([float(x) for x in extrinsics.split(' ')]))
+
+
+def camera_timestamps(traverse, camera, from_tars=False):
+    # image timestamps from the .timestamps file of the camera if the dataset provides one, otherwise from the
+    # extracted images or the headers of the unextracted chunk archives
+    timestamps_path = find_timestamps_file(traverse, camera, RAW_DIR)
+    if timestamps_path is not None:
+        return np.unique(load_timestamps(timestamps_path)[0])
+    if from_tars:
+        tstamps = tar_timestamps(find_tars(traverse, camera))
+        if not tstamps:
+            raise FileNotFoundError("No archives found for traverse {} and camera {}.".format(traverse, camera))
+    else:
+        img_folder = os.path.join(RAW_DIR, traverse, camera)
+        img_paths = os.listdir(img_folder)
+        if not img_paths:
+            raise FileNotFoundError("No images ready! Run ready_images.py on traverse/camera pair first.")
+        tstamps = [int(os.path.basename(img_path)[:-4]) for img_path in img_paths if img_path.endswith(".png")]
+    return np.unique(tstamps)
+
+
+def assign_traverse_poses(traverse, cameras, from_tars=False):
+    """
+    Writes camera_poses.csv and camera_poses.npy for each camera of a traverse. The RTK log is
+    loaded once and interpolated once at the union of the image timestamps
+    of all cameras, then each camera's extrinsics are applied to its poses
+    as one batched matrix product.
+    """
     sdk_path = os.path.abspath(sdk.__file__)
     extrinsics_dir = os.path.join(os.path.dirname(sdk_path), 'extrinsics')
-    save_dir = os.path.join(READY_DIR, traverse, camera)
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-    # retrieve list of image tstamps
-    img_folder = os.path.join(RAW_DIR, traverse, camera)
-    img_paths = os.listdir(img_folder)
-    if not img_paths:
-        raise FileNotFoundError("No images ready! Run ready_images.py on traverse/camera pair first.")
-    tstamps = sorted([int(os.path.basename(img_path)[:-4]) for img_path in img_paths if img_path.endswith(".png")])
+    tstamps = {camera: camera_timestamps(traverse, camera, from_tars) for camera in cameras}
+    all_tstamps = np.unique(np.concatenate(list(tstamps.values())))
     rtk_path = os.path.join(RAW_DIR, traverse, 'rtk.csv')
-    interp_poses = np.asarray(interpolate_ins_poses(rtk_path, tstamps, use_rtk=True))
+    interp_poses = interpolate_ins_poses_array(rtk_path, all_tstamps, use_rtk=True)
     # apply camera extrinsics to INS for abs camera poses. Note extrinsics are relative
     # to the STEREO camera, so compose extrinsics for ins and mono to get true cam pose
-    with open(os.path.join(extrinsics_dir, 'ins.txt')) as extrinsics_file:
-        extrinsics = next(extrinsics_file)
-    T_ext_ste_ins = np.asarray(build_se3_transform([float(x) for x in extrinsics.split(' ')]))
-    cam_name = "stereo" if "stereo" in camera else camera
-    with open(os.path.join(extrinsics_dir, '{}.txt'.format(cam_name))) as extrinsics_file:
-        extrinsics = next(extrinsics_file)
-    # relative pose of camera to stereo camera (origin frame)
-    T_ext_stereo = np.asarray(build_se3_transform([float(x) for x in extrinsics.split(' ')]))
-    # relative pose to INS/RTK sensor from stereo camera
-    T_ext = np.linalg.solve(T_ext_ste_ins, T_ext_stereo)
-    poses = interp_poses @ T_ext
-    xyzrpys = [se3_to_components(pose) for pose in poses]
-    df = pd.DataFrame(xyzrpys, columns=["northing", "easting", "down", "roll", "pitch", "yaw"])
-    df.insert(0, "timestamp", tstamps, True)
-    df.to_csv(os.path.join(save_dir, "camera_poses.csv"))
+    T_ext_ste_ins = load_extrinsics(extrinsics_dir, 'ins')
+    for camera in cameras:
+        save_dir = os.path.join(READY_DIR, traverse, camera)
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        cam_name = "stereo" if "stereo" in camera else camera
+        # relative pose of camera to stereo camera (origin frame)
+        T_ext_stereo = load_extrinsics(extrinsics_dir, cam_name)
+        # relative pose to INS/RTK sensor from stereo camera
+        T_ext = np.linalg.solve(T_ext_ste_ins, T_ext_stereo)
+        poses = interp_poses[np.searchsorted(all_tstamps, tstamps[camera])] @ T_ext
+        save_camera_poses(save_dir, tstamps[camera], poses)
+
+
+def assign_poses(traverse, camera, from_tars=False):
+    assign_traverse_poses(traverse, [camera], from_tars)
 
 
 if __name__ == "__main__":
@@ -68,8 +95,15 @@ if __name__ == "__main__":
             "e.g. mono_left|right|rear stereo/left|centre|right"
         ),
     )
+    parser.add_argument(
+        "--from-tars",
+        action="store_true",
+        help=(
+            "Read image timestamps from the unextracted chunk archives in RAW_DIR, "
+            "e.g. 2015-03-24-13-47-33_stereo_centre_01.tar"
+        ),
+    )
     args = parser.parse_args() 
     cameras = camera_names if "all" in args.cameras else args.cameras
     for traverse in args.traverses:
-        for camera in cameras:
-            assign_poses(traverse, camera)
+        assign_traverse_poses(traverse, cameras, args.from_tars)
@@ -0,0 +1,182 @@
+import time
+import queue
+import threading
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+
+class StageStats:
+    """
+    Thread-safe throughput counters for one pipeline stage. Busy time is the
+    time spent inside the stage function, summed over all workers of the stage,
+    so utilisation close to 100% marks the stage that bottlenecks the pipeline.
+    """
+    def __init__(self, name, n_workers):
+        self.name = name
+        self.n_workers = n_workers
+        self.count = 0
+        self.busy = 0.
+        self._lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self._lock:
+            self.count += 1
+            self.busy += elapsed
+
+    def utilisation(self, wall):
+        return self.busy / (wall * self.n_workers) if wall > 0 else 0.
+
+    def summary(self, wall):
+        rate = self.count / wall if wall > 0 else 0.
+        return "{}: {} items, {:.1f} items/s, {} workers {:.0%} busy".format(
+            self.name, self.count, rate, self.n_workers, self.utilisation(wall))
+
+
+def _timed_call(fn, item):
+    start = time.time()
+    result = fn(item)
+    return time.time() - start, result
+
+
+class Pipeline:
+    """
+    Runs tasks through bounded read -> process -> write stages. Reads and writes
+    run in I/O threads, processing runs in a process pool. At most `queue_size`
+    read items wait for a process and at most `n_processes + queue_size` items are
+    between being submitted for processing and written, so memory stays bounded
+    regardless of how far the reads get ahead of the CPU or the writes.
+
+    Args:
+        read_fn (callable): task -> item, run in reader threads. If `read_yields` is
+            set, task -> iterable of items instead, e.g. every image in an archive.
+        process_fn (callable): item -> result, run in worker processes. Must be picklable.
+        write_fn (callable): result -> None, run in writer threads.
+        n_readers, n_processes, n_writers (int): workers per stage.
+        queue_size (int): bound on the number of items queued between stages.
+        initializer, initargs: passed to the process pool.
+        read_yields (bool): whether read_fn yields several items per task.
+    """
+    def __init__(self, read_fn, process_fn, write_fn, n_readers=2, n_processes=4, n_writers=2,
+                 queue_size=16, initializer=None, initargs=(), read_yields=False):
+        self.read_fn = read_fn
+        self.read_yields = read_yields
+        self.process_fn = process_fn
+        self.write_fn = write_fn
+        self.n_readers = n_readers
+        self.n_processes = n_processes
+        self.n_writers = n_writers
+        self.queue_size = queue_size
+        self.initializer = initializer
+        self.initargs = initargs
+        self.stats = [StageStats("read", n_readers), StageStats("process", n_processes),
+                      StageStats("write", n_writers)]
+        self.errors = []
+        self.wall = 0.
+
+    def run(self, tasks, desc=None, total=None):
+        """
+        Processes all tasks and returns a list of (task or result, exception)
+        pairs for any that failed. Per stage throughput is in `self.stats`.
+        `total` is the number of items expected, if not one per task. Tasks
+        are consumed lazily by the readers, so they can be a generator if
+        `total` is given.
+        """
+        read_stats, process_stats, write_stats = self.stats
+        if total is None:
+            tasks = list(tasks)
+            total = len(tasks)
+        task_iter = iter(tasks)
+        task_lock = threading.Lock()
+        read_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue()
+        # bounds items in flight between submission to the pool and being written
+        slots = threading.BoundedSemaphore(self.n_processes + self.queue_size)
+        errors_lock = threading.Lock()
+        pbar = tqdm(total=total, desc=desc)
+        start = time.time()
+
+        def record_error(obj, e):
+            with errors_lock:
+                self.errors.append((obj, e))
+                pbar.update()
+
+        def reader():
+            while True:
+                with task_lock:
+                    task = next(task_iter, None)
+                if task is None:
+                    read_queue.put(None)
+                    return
+                t = time.time()
+                try:
+                    if not self.read_yields:
+                        item = self.read_fn(task)
+                        read_stats.add(time.time() - t)
+                        read_queue.put(item)
+                        continue
+                    for item in self.read_fn(task):
+                        read_stats.add(time.time() - t)
+                        read_queue.put(item)
+                        t = time.time()
+                except Exception as e:
+                    record_error(task, e)
+
+        def writer():
+            while True:
+                result = write_queue.get()
+                if result is None:
+                    return
+                t = time.time()
+                try:
+                    self.write_fn(result)
+                    write_stats.add(time.time() - t)
+                    with errors_lock:
+                        pbar.update()
+                        if write_stats.count % 50 == 0:
+                            pbar.set_postfix_str(self._postfix(time.time() - start))
+                except Exception as e:
+                    record_error(result, e)
+                finally:
+                    slots.release()
+
+        def on_processed(timed_result):
+            elapsed, result = timed_result
+            process_stats.add(elapsed)
+            write_queue.put(result)
+
+        def on_process_error(item, e):
+            record_error(item, e)
+            slots.release()
+
+        threads = [threading.Thread(target=reader, daemon=True) for _ in range(self.n_readers)]
+        threads += [threading.Thread(target=writer, daemon=True) for _ in range(self.n_writers)]
+        for thread in threads:
+            thread.start()
+
+        with Pool(self.n_processes, initializer=self.initializer, initargs=self.initargs) as pool:
+            finished_readers = 0
+            while finished_readers < self.n_readers:
+                item = read_queue.get()
+                if item is None:
+                    finished_readers += 1
+                    continue
+                slots.acquire()
+                pool.apply_async(_timed_call, (self.process_fn, item), callback=on_processed,
+                                 error_callback=lambda e, item=item: on_process_error(item, e))
+            pool.close()
+            pool.join()
+
+        for _ in range(self.n_writers):
+            write_queue.put(None)
+        for thread in threads:
+            thread.join()
+        pbar.close()
+        self.wall = time.time() - start
+        return self.errors
+
+    def _postfix(self, wall):
+        return " ".join("{} {:.0%}".format(s.name, s.utilisation(wall)) for s in self.stats)
+
+    def summary(self):
+        return "\n".join(s.summary(self.wall) for s in self.stats)
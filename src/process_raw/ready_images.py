@@ -1,68 +1,408 @@
 import os
+import io
 import argparse
 import sys
-import itertools
-from multiprocessing import Pool
+import tempfile
+import shutil
+import threading
+import json
+import struct
+import zlib
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 from tqdm import tqdm, trange
 import PIL
+import cv2
 
-from src.settings import RAW_DIR, READY_DIR
+from src.settings import RAW_DIR, READY_DIR, CACHE_DIR
+from src.process_raw.pipeline import Pipeline
+from src.process_raw.shards import ShardWriter, ShardReader, load_index
+from src.process_raw.tar_source import find_tars, list_tar_images, read_tar_images
+from src.process_raw.timestamps import find_timestamps_file, load_timestamps
+from src.util.atomic import atomic_write
 import src.thirdparty.robotcar_dataset_sdk as sdk
 from src.thirdparty.robotcar_dataset_sdk.python import image
-from src.thirdparty.robotcar_dataset_sdk.python.camera_model import CameraModel
+from src.thirdparty.robotcar_dataset_sdk.python.camera_model import CameraModel, UNDISTORT_METHODS
 sdk_dir = os.path.dirname(sdk.__file__)
 models_dir = os.path.join(sdk_dir, "models")
 
 
-def validate_images(traverse, camera):
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def check_png(data):
 	"""
-	TODO:
-	Check set of images against timestamps file to identify any missing images.
+	Checks the structure of an encoded PNG without decoding it: the signature,
+	an IHDR chunk first, the CRC of every chunk and an IEND chunk at the end of
+	the data. Returns True if all checks pass, so truncated or partially written
+	files are caught at a fraction of the cost of decompressing them.
 	"""
-	return None
+	if not data.startswith(PNG_SIGNATURE):
+		return False
+	pos = len(PNG_SIGNATURE)
+	first = True
+	while pos + 12 <= len(data):
+		length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+		end = pos + 12 + length
+		if end > len(data) or (first and chunk_type != b'IHDR'):
+			return False
+		crc, = struct.unpack('>I', data[end - 4:end])
+		if zlib.crc32(data[pos + 4:end - 4]) & 0xffffffff != crc:
+			return False
+		if chunk_type == b'IEND':
+			return end == len(data)
+		pos = end
+		first = False
+	return False
 
 
-def process_and_save_image(paths):
-	img_path = paths[0]
-	save_path = paths[1]
-	cm = paths[2]
-	arr = image.load_image(img_path, cm)
-	img = PIL.Image.fromarray(arr)
-	img.save(save_path)
-	return
+def check_png_file(path):
+	try:
+		with open(path, 'rb') as f:
+			return check_png(f.read())
+	except OSError:
+		return False
 
 
-def ready_images(traverse, camera, nWorkers=4, overwrite=True):
-	# load and undistort images
+def validate_images(traverse, camera, nWorkers=8, output='png', from_tars=False, report_path=None):
+	"""
+	Checks the raw and ready images of a traverse/camera pair against its
+	.timestamps file. Reports timestamps missing from either, raw or ready
+	PNGs that fail the header and CRC checks of check_png (run in parallel),
+	and extra images that are not in the timestamps file. Missing raw images
+	are also grouped by the chunk column of the timestamps file, which points
+	at chunk archives that failed to download or extract. The report is
+	returned and written as JSON to READY_DIR/<traverse>/<camera>/validation.json
+	unless report_path is given.
+	"""
+	timestamps_path = find_timestamps_file(traverse, camera, RAW_DIR)
+	chunks = {}
+	if timestamps_path is not None:
+		tstamps, chunk_column = load_timestamps(timestamps_path)
+		chunks = dict(zip(tstamps.tolist(), chunk_column.tolist() if chunk_column is not None else [None] * len(tstamps)))
+
+	# raw images, integrity is only checked for extracted images
 	image_folder_path = os.path.join(RAW_DIR, traverse, camera)
-	cm = CameraModel(
-		models_dir, image_folder_path
-		)  # this is a variable used in process_and_save_image
-	try:
-		fnames = os.listdir(image_folder_path)
-	except FileNotFoundError:
-		print("Folder {} not found, please check that this traverse/camera combination exists.")
-		return
-	ready_folder_path = os.path.join(READY_DIR, traverse, camera, "images")
-	if not overwrite and os.path.exists(ready_folder_path):
-		ready_fnames = os.listdir(ready_folder_path)
-		img_fnames = [img_path for img_path in os.listdir(image_folder_path) 
-			if img_path.endswith(".png") and img_path not in ready_fnames]
+	if from_tars:
+		raw_paths = {int(fname[:-4]): None for fname in list_tar_images(find_tars(traverse, camera))}
+	elif os.path.isdir(image_folder_path):
+		raw_paths = {int(fname[:-4]): os.path.join(image_folder_path, fname)
+			for fname in os.listdir(image_folder_path) if fname.endswith('.png')}
+	else:
+		raw_paths = {}
+	if timestamps_path is None:
+		tqdm.write("No timestamps file found for traverse {} and camera {}, validating against raw images.".format(
+			traverse, camera))
+		chunks = {ts: None for ts in raw_paths}
+
+	ready_folder_path = os.path.join(READY_DIR, traverse, camera, "images" if output == 'png' else "shards")
+	if output == 'png':
+		ready_tstamps = [int(fname[:-4]) for fname in os.listdir(ready_folder_path) if fname.endswith('.png')] \
+			if os.path.isdir(ready_folder_path) else []
 	else:
-		img_fnames = [img_path for img_path in os.listdir(image_folder_path) if img_path.endswith(".png")]
-		if not os.path.exists(ready_folder_path):
-			os.makedirs(ready_folder_path)
+		reader = ShardReader(ready_folder_path)
+		ready_tstamps = [int(ts) for ts in reader.index['timestamp']]
+
+	def check_ready(ts):
+		if output == 'png':
+			return check_png_file(os.path.join(ready_folder_path, "{}.png".format(ts)))
+		return check_png(reader.read(ts))
+
+	raw_checked = sorted(ts for ts, path in raw_paths.items() if path is not None)
+	ready_checked = sorted(set(ready_tstamps))
+	with ThreadPool(nWorkers) as pool:
+		raw_ok = list(tqdm(pool.imap(check_png_file, [raw_paths[ts] for ts in raw_checked], chunksize=16),
+			total=len(raw_checked), desc="checking raw"))
+		if output == 'png':
+			ready_ok = list(tqdm(pool.imap(check_ready, ready_checked, chunksize=16),
+				total=len(ready_checked), desc="checking ready"))
+	if output != 'png':
+		# shards share file handles, so check them sequentially
+		ready_ok = [check_ready(ts) for ts in tqdm(ready_checked, desc="checking ready")]
+		reader.close()
+
+	expected = set(chunks)
+	raw_missing = sorted(expected - set(raw_paths))
+	report = {
+		"traverse": traverse,
+		"camera": camera,
+		"timestamps_file": timestamps_path,
+		"expected": len(expected),
+		"raw": {
+			"missing": raw_missing,
+			"missing_chunks": sorted(set(chunks[ts] for ts in raw_missing if chunks[ts] is not None)),
+			"corrupt": [ts for ts, ok in zip(raw_checked, raw_ok) if not ok],
+			"extra": sorted(set(raw_paths) - expected),
+		},
+		"ready": {
+			"missing": sorted(expected - set(ready_tstamps)),
+			"corrupt": [ts for ts, ok in zip(ready_checked, ready_ok) if not ok],
+			"extra": sorted(set(ready_tstamps) - expected),
+		},
+	}
+	if report_path is None:
+		report_path = os.path.join(READY_DIR, traverse, camera, "validation.json")
+	if not os.path.exists(os.path.dirname(report_path)):
+		os.makedirs(os.path.dirname(report_path))
+	with open(report_path, 'w') as f:
+		json.dump(report, f, indent=1)
+	return report
+
+
+def parse_size(spec, image_width=None):
+	"""
+	Parses a resized variant spec, either a downsampling fraction e.g. '1/2' or a
+	fixed width in pixels e.g. 'w320'. Returns (scale, width) with one of them None.
+	Widths are checked against image_width, the width of the image being resized, if given.
+	"""
 	try:
-		full_raw_path = [os.path.join(image_folder_path, fname) for fname in img_fnames]
-		full_ready_path = [os.path.join(ready_folder_path, fname) for fname in img_fnames]
-		with Pool(nWorkers) as pool:
-			ready_images = list(tqdm(pool.imap(process_and_save_image,
-								zip(full_raw_path, full_ready_path, itertools.repeat(cm))),
-								total=len(full_raw_path)))
-	except FileNotFoundError as e:
-		print(e)
+		if spec.startswith('w'):
+			scale, width = None, int(spec[1:])
+		else:
+			numerator, _, denominator = spec.partition('/')
+			scale, width = float(numerator) / float(denominator or 1), None
+	except (ValueError, ZeroDivisionError):
+		raise ValueError("Invalid resized variant {}, expected a fraction e.g. 1/2 or a width e.g. w320".format(spec))
+	if scale is not None:
+		downsamples = 0 < scale <= 1
+	else:
+		downsamples = 0 < width and (image_width is None or width <= image_width)
+	if not downsamples:
+		raise ValueError("Resized variant {} must downsample the image".format(spec))
+	return scale, width
+
+
+def variant_folder(folder, spec):
+	# e.g. images -> images_1_2 for spec '1/2', shards -> shards_w320 for spec 'w320'
+	return folder if spec is None else "{}_{}".format(folder, spec.replace('/', '_'))
+
+
+def resize_image(arr, spec):
+	scale, width = parse_size(spec)
+	if width is None:
+		width = int(round(arr.shape[1] * scale))
+	height = int(round(arr.shape[0] * width / arr.shape[1]))
+	return cv2.resize(arr, (width, height), interpolation=cv2.INTER_AREA)
+
+
+# camera models (by camera) and processing options of a worker process, set once by init_worker. The pool is
+# shared by all traverse/camera pairs of a batch, so each worker holds the model of every camera in the batch.
+worker_cms = {}
+worker_options = None
+worker_sizes = []
+
+
+def init_worker(cms, undistort_method, demosaic_method, sizes=()):
+	global worker_cms, worker_options, worker_sizes
+	worker_cms = cms
+	worker_options = (undistort_method, demosaic_method)
+	worker_sizes = sizes
+
+
+def read_raw_image(task):
+	raw_path, fname = task
+	with open(raw_path, 'rb') as f:
+		return f.read(), fname
+
+
+def read_pair_task(task, from_tars=False, tar_fnames=None):
+	# yields (key, data, fname) for a task of any pair in the batch, key being (traverse, camera). Tasks are archive
+	# paths if reading from the chunk archives, otherwise (raw_path, fname).
+	key, pair_task = task
+	if from_tars:
+		for data, fname in read_tar_images(pair_task, tar_fnames[key]):
+			yield key, data, fname
+	else:
+		data, fname = read_raw_image(pair_task)
+		yield key, data, fname
+
+
+def process_image(item):
+	# demosaic, undistort and re-encode a raw PNG, entirely in memory. Resized variants are produced from the
+	# undistorted array in the same pass, returned after the full size image in the order of worker_sizes.
+	key, data, fname = item
+	arr = image.load_image(io.BytesIO(data), worker_cms[key[1]], *worker_options)
+	encoded = []
+	for resized in [arr] + [resize_image(arr, spec) for spec in worker_sizes]:
+		buf = io.BytesIO()
+		PIL.Image.fromarray(resized).save(buf, format='PNG')
+		encoded.append(buf.getvalue())
+	return key, encoded, fname
+
+
+def write_ready_image(ready_folder_paths, result):
+	encoded, fname = result
+	for ready_folder_path, data in zip(ready_folder_paths, encoded):
+		# a killed job never leaves a truncated PNG under the final name
+		with atomic_write(os.path.join(ready_folder_path, fname)) as f:
+			f.write(data)
+
+
+def write_ready_shard(shard_writers, result):
+	encoded, fname = result
+	for shard_writer, data in zip(shard_writers, encoded):
+		shard_writer.add(fname, data)
+
+
+def plan_ready_images(traverse, camera, nWorkers=4, overwrite=True, output='png', sizes=(), from_tars=False,
+		repair=False, demosaic_method='colour'):
+	"""
+	Lists the images of a traverse/camera pair that still need readying. Returns (tasks, fnames, image_size,
+	ready_folder_paths) where tasks are archive paths if from_tars is set and (raw_path, fname) otherwise, and
+	image_size is the (height, width) of the raw images. Returns None if the raw images are not found, and no
+	fnames if all images are ready already. Raises ValueError, before any ready output is removed, if a resized
+	variant in sizes is wider than the ready images.
+	"""
+	image_folder_path = os.path.join(RAW_DIR, traverse, camera)
+	# raw images are either extracted into image_folder_path, or read straight from the downloaded chunk archives
+	if from_tars:
+		tar_paths = find_tars(traverse, camera)
+		raw_fnames = list_tar_images(tar_paths)
+		if not raw_fnames:
+			print("No archives found for traverse {} and camera {} in {}.".format(traverse, camera, RAW_DIR))
+			return None
+	else:
+		try:
+			raw_fnames = [fname for fname in os.listdir(image_folder_path) if fname.endswith(".png")]
+		except FileNotFoundError:
+			print("Folder {} not found, please check that this traverse/camera combination exists.".format(
+				image_folder_path))
+			return None
+	if raw_fnames:
+		if from_tars:
+			width, height = PIL.Image.open(io.BytesIO(next(read_tar_images(tar_paths[0]))[0])).size
+		else:
+			width, height = PIL.Image.open(os.path.join(image_folder_path, raw_fnames[0])).size
+		for spec in sizes:
+			parse_size(spec, width // 2 if demosaic_method == 'superpixel' else width)
+	# output is either one PNG per image in images/ or tar shards with a timestamp index in shards/. Resized
+	# variants go to sibling folders, e.g. images_1_2/ for size '1/2'. Resuming is based on the full size output.
+	ready_folder_paths = [os.path.join(READY_DIR, traverse, camera, variant_folder(
+		"images" if output == 'png' else "shards", spec)) for spec in [None] + list(sizes)]
+	ready_folder_path = ready_folder_paths[0]
+	if repair:
+		# only re-process images that validate_images reports missing or corrupt and that have an intact raw image.
+		# Rewritten PNGs replace the corrupt ones, rewritten shard entries go into new shards which take precedence.
+		report = validate_images(traverse, camera, nWorkers, output, from_tars)
+		raw_bad = set(report["raw"]["missing"] + report["raw"]["corrupt"])
+		bad = set(report["ready"]["missing"] + report["ready"]["corrupt"]) - raw_bad
+		img_fnames = [fname for fname in raw_fnames if int(fname[:-4]) in bad]
+		tqdm.write("repairing {} images of traverse {} and camera {}".format(len(img_fnames), traverse, camera))
+	elif not overwrite and os.path.exists(ready_folder_path):
+		if output == 'png':
+			ready_fnames = set(os.listdir(ready_folder_path))
+		else:
+			ready_fnames = set("{}.png".format(ts) for ts in load_index(ready_folder_path)["timestamp"])
+		img_fnames = [fname for fname in raw_fnames if fname not in ready_fnames]
+	else:
+		img_fnames = raw_fnames
+		for folder_path in ready_folder_paths:
+			if output == 'shards' and os.path.exists(folder_path):
+				shutil.rmtree(folder_path)
+	if not img_fnames:
+		return [], [], None, ready_folder_paths
+	if from_tars:
+		tasks = tar_paths
+	else:
+		tasks = [(os.path.join(image_folder_path, fname), fname) for fname in img_fnames]
+	return tasks, img_fnames, (height, width), ready_folder_paths
+
+
+def ready_batch(pairs, nWorkers=4, overwrite=True, undistort_method='map_coordinates', demosaic_method='colour',
+		cache_dir=CACHE_DIR, nReaders=2, nWriters=2, queue_size=16, output='png', shard_size=1 << 30, sizes=(),
+		from_tars=False, repair=False):
+	"""
+	Readies the images of all (traverse, camera) pairs as one job. Images of every pair are streamed through a
+	single pipeline, so the worker pool is started once and stays busy across pairs instead of draining at the
+	end of each, and the progress bar and ETA cover the whole batch. Each camera model is loaded and its maps
+	built once, and each worker holds the models of all cameras in the batch.
+	"""
+	for spec in sizes:
+		parse_size(spec)  # fail on invalid sizes before any work is done
+	plans = {}
+	for traverse, camera in tqdm(pairs, desc="listing images"):
+		try:
+			plan = plan_ready_images(traverse, camera, nWorkers, overwrite, output, sizes, from_tars, repair,
+				demosaic_method)
+		except FileNotFoundError as e:
+			print(e)
+			continue
+		if plan is None:
+			continue
+		if plan[1]:
+			plans[(traverse, camera)] = plan
+		else:
+			tqdm.write("traverse {} and camera {} complete!".format(traverse, camera))
+	if not plans:
+		return
+
+	# load each camera model and build its undistortion maps once, then memory-map them, so that workers attach
+	# to shared pages and each task only carries the image data. Maps loaded from the model cache are already
+	# memory-mapped.
+	cms = {}
+	for (traverse, camera), (_, _, (height, width), _) in plans.items():
+		if camera not in cms:
+			cms[camera] = CameraModel(models_dir, os.path.join(RAW_DIR, traverse, camera), cache_dir)
+		if demosaic_method == 'superpixel':
+			height, width = height // 2, width // 2
+		cms[camera].undistort_maps((height, width), undistort_method)
+
+	remaining = {key: len(plan[1]) for key, plan in plans.items()}
+	tar_fnames = {key: set(plan[1]) for key, plan in plans.items()} if from_tars else None
+	total = sum(remaining.values())
+	tasks = ((key, task) for key, plan in plans.items() for task in plan[0])
+	shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+	with tempfile.TemporaryDirectory(dir=shm_dir) as share_dir:
+		if not cache_dir:
+			for camera, cm in cms.items():
+				camera_share_dir = os.path.join(share_dir, camera.replace('/', '_'))
+				os.makedirs(camera_share_dir)
+				cm.share_memory(camera_share_dir)
+		write_fns = {}
+		shard_writers = {}
+		for key, (_, _, _, ready_folder_paths) in plans.items():
+			if output == 'png':
+				for folder_path in ready_folder_paths:
+					if not os.path.exists(folder_path):
+						os.makedirs(folder_path)
+				write_fns[key] = partial(write_ready_image, ready_folder_paths)
+			else:
+				shard_writers[key] = [ShardWriter(folder_path, shard_size) for folder_path in ready_folder_paths]
+				write_fns[key] = partial(write_ready_shard, shard_writers[key])
+		remaining_lock = threading.Lock()
+
+		def write_fn(result):
+			key, encoded, fname = result
+			write_fns[key]((encoded, fname))
+			with remaining_lock:
+				remaining[key] -= 1
+				done = remaining[key] == 0
+			if done:
+				for shard_writer in shard_writers.get(key, []):
+					shard_writer.close()
+				tqdm.write("traverse {} and camera {} complete!".format(*key))
+
+		read_fn = partial(read_pair_task, from_tars=from_tars, tar_fnames=tar_fnames)
+		pipeline = Pipeline(read_fn, process_image, write_fn, nReaders, nWorkers, nWriters, queue_size,
+			initializer=init_worker, initargs=(cms, undistort_method, demosaic_method, sizes), read_yields=True)
+		errors = pipeline.run(tasks, desc="{} traverse/camera pairs".format(len(plans)), total=total)
+		for writers in shard_writers.values():
+			for shard_writer in writers:
+				shard_writer.close()
+	tqdm.write(pipeline.summary())
+	for obj, e in errors:
+		# failed reads of an archive report the archive path, otherwise the image file name
+		name = obj[-1] if isinstance(obj[-1], str) else obj[-1][1]
+		tqdm.write("failed to ready {} of traverse {} and camera {}: {}".format(name, obj[0][0], obj[0][1], e))
 	return
+
+
+def ready_images(traverse, camera, nWorkers=4, overwrite=True, undistort_method='map_coordinates',
+		demosaic_method='colour', cache_dir=CACHE_DIR, nReaders=2, nWriters=2, queue_size=16, output='png',
+		shard_size=1 << 30, sizes=(), from_tars=False, repair=False):
+	ready_batch([(traverse, camera)], nWorkers, overwrite, undistort_method, demosaic_method, cache_dir, nReaders,
+		nWriters, queue_size, output, shard_size, sizes, from_tars, repair)
 	
 
 if __name__ == "__main__":
@@ -74,19 +414,58 @@ if __name__ == "__main__":
 			choices = ["stereo/left", "stereo/right", "stereo/centre", "mono_left", "mono_right", "mono_rear"],
 			help="<Required> which cameras to undistort for each traverse. Valid options include"
 			"stereo/left, stereo/right, stereo/centre, mono_left, mono_right, mono_rear")
-	parser.add_argument('-n', '--nWorkers', type=int, default=8, help="Number of workers to use")
+	parser.add_argument('-n', '--nWorkers', type=int, default=8,
+			help="Number of worker processes to use for decoding and undistortion")
+	parser.add_argument('--nReaders', type=int, default=2, help="Number of I/O threads reading raw images")
+	parser.add_argument('--nWriters', type=int, default=2, help="Number of I/O threads writing ready images")
+	parser.add_argument('--queue-size', type=int, default=16,
+			help="Maximum number of images buffered between pipeline stages")
 	parser.add_argument('-o', '--overwrite', action='store_true',
 			help="Overwrite already completed images i.e. do not resume.")
+	parser.add_argument('-u', '--undistort', type=str, default='map_coordinates', choices=UNDISTORT_METHODS,
+			help="Undistortion backend. 'remap' and 'remap_fixed' use cached OpenCV maps and are much faster, "
+			"matching 'map_coordinates' to within 1 intensity level away from the image border.")
+	parser.add_argument('-d', '--demosaic', type=str, default='colour', choices=image.DEMOSAIC_METHODS,
+			help="Demosaicing backend. 'bilinear_int' gives identical output to 'colour' using integer arithmetic, "
+			"'superpixel' collapses each 2x2 Bayer cell to produce half resolution images.")
+	parser.add_argument('--output', type=str, default='png', choices=['png', 'shards'],
+			help="Write one PNG per image (default), or pack images into large tar shards indexed by timestamp, "
+			"see src/process_raw/shards.py.")
+	parser.add_argument('--shard-size', type=int, default=1024, help="Approximate size of each shard in MB")
+	parser.add_argument('-s', '--sizes', nargs='+', type=str, default=[],
+			help="Resized variants to write in the same pass as the full size images, as downsampling fractions "
+			"e.g. 1/2 1/4 or fixed widths e.g. w320. Each is written to a sibling folder e.g. images_1_2.")
+	parser.add_argument('--from-tars', action='store_true',
+			help="Read raw images straight from the chunk archives in RAW_DIR downloaded with "
+			"scrape_mrgdatashare.py --no_extract, e.g. 2015-03-24-13-47-33_stereo_centre_01.tar, without extracting them.")
+	parser.add_argument('--validate', action='store_true',
+			help="Only check the raw and ready images against the .timestamps files and write a report of missing, "
+			"corrupt and extra images to validation.json in each ready camera folder.")
+	parser.add_argument('--repair', action='store_true',
+			help="Validate and re-process only the ready images reported missing or corrupt.")
+	parser.add_argument('--cache-dir', type=str, default=CACHE_DIR,
+			help="Directory of the persistent camera model cache. Pass an empty string to disable the cache.")
 	args = parser.parse_args()
 	
 	# parse traverse directories
-	all_traverses = [f for f in os.listdir(RAW_DIR) if f.startswith("201")]
+	# traverse folders or chunk archives, e.g. 2015-03-24-13-47-33 or 2015-03-24-13-47-33_stereo_centre_01.tar
+	all_traverses = sorted(set(f[:19] for f in os.listdir(RAW_DIR) if f.startswith("201")))
 	if 'all' in args.traverses:	
 		traverses = all_traverses
 	else:
 		traverses = args.traverses
 
-	for i in trange(len(traverses)):
-		for j in trange(len(args.cameras)):
-			ready_images(traverses[i], args.cameras[j], args.nWorkers, args.overwrite)
-			tqdm.write("traverse {} and camera {} complete!".format(traverses[i], args.cameras[j]))
+	if args.validate:
+		for i in trange(len(traverses)):
+			for j in trange(len(args.cameras)):
+				report = validate_images(traverses[i], args.cameras[j], args.nWorkers, args.output, args.from_tars)
+				tqdm.write("traverse {} and camera {}: {} expected, raw {}, ready {}".format(
+					traverses[i], args.cameras[j], report["expected"],
+					", ".join("{} {}".format(len(v), k) for k, v in report["raw"].items() if k != "missing_chunks"),
+					", ".join("{} {}".format(len(v), k) for k, v in report["ready"].items())))
+	else:
+		# all traverse/camera pairs are readied as one job, see ready_batch
+		pairs = [(traverse, camera) for traverse in traverses for camera in args.cameras]
+		ready_batch(pairs, args.nWorkers, args.overwrite, args.undistort, args.demosaic, args.cache_dir,
+			args.nReaders, args.nWriters, args.queue_size, args.output, args.shard_size << 20, args.sizes,
+			args.from_tars, args.repair)
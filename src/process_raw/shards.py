@@ -0,0 +1,146 @@
+import os
+import io
+import glob
+import tarfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+# index entry of each image: its timestamp, the shard holding it and the byte range of the PNG in that shard
+INDEX_DTYPE = np.dtype([("timestamp", np.int64), ("shard", np.int32), ("offset", np.int64), ("size", np.int64)])
+
+
+def shard_path(shard_dir, shard):
+    return os.path.join(shard_dir, "shard-{:05d}.tar".format(shard))
+
+
+def index_path(shard_dir, shard):
+    return os.path.join(shard_dir, "shard-{:05d}.idx.npy".format(shard))
+
+
+def _shard_numbers(shard_dir):
+    return sorted(int(os.path.basename(path)[6:11]) for path in glob.glob(os.path.join(shard_dir, "shard-*.tar")))
+
+
+def load_index(shard_dir):
+    """
+    Returns the concatenated index of all complete shards in a directory.
+    Shards without an index file were not closed and are not included.
+    """
+    indices = [np.load(index_path(shard_dir, shard)) for shard in _shard_numbers(shard_dir)
+               if os.path.isfile(index_path(shard_dir, shard))]
+    return np.concatenate(indices) if indices else np.empty(0, INDEX_DTYPE)
+
+
+class ShardWriter:
+    """
+    Packs images into plain tar shards of roughly `shard_size` bytes, so a
+    traverse is stored as a few large files instead of tens of thousands of
+    small ones. Shards can be read with any tar tool. When a shard is
+    closed, an index file mapping each timestamp to the offset and size of
+    its PNG within the shard is written next to it. Shards left without an
+    index by a killed job are removed on open, and new shards are numbered
+    after the existing complete ones, so processing can resume. Safe to use
+    from several writer threads.
+    """
+    def __init__(self, shard_dir, shard_size=1 << 30):
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size
+        self._lock = threading.Lock()
+        self._tar = None
+        self._index = []
+        if not os.path.exists(shard_dir):
+            os.makedirs(shard_dir)
+        complete = []
+        for shard in _shard_numbers(shard_dir):
+            if os.path.isfile(index_path(shard_dir, shard)):
+                complete.append(shard)
+            else:
+                os.remove(shard_path(shard_dir, shard))
+        self._shard = complete[-1] + 1 if complete else 0
+
+    def add(self, name, data):
+        """
+        Appends the encoded image `data` with file name `name` (<timestamp>.png).
+        """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        with self._lock:
+            if self._tar is None:
+                self._tar = tarfile.open(shard_path(self.shard_dir, self._shard), "w")
+            self._tar.addfile(info, io.BytesIO(data))
+            blocks, remainder = divmod(len(data), tarfile.BLOCKSIZE)
+            padded_size = (blocks + (remainder > 0)) * tarfile.BLOCKSIZE
+            data_offset = self._tar.offset - padded_size
+            self._index.append((int(os.path.splitext(name)[0]), self._shard, data_offset, len(data)))
+            if self._tar.offset >= self.shard_size:
+                self._close_shard()
+
+    def _close_shard(self):
+        self._tar.close()
+        np.save(index_path(self.shard_dir, self._shard), np.array(self._index, INDEX_DTYPE))
+        self._tar = None
+        self._index = []
+        self._shard += 1
+
+    def close(self):
+        with self._lock:
+            if self._tar is not None:
+                self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardReader:
+    """
+    Random access to images in a shard directory by timestamp. The index is
+    held as a dict, so each lookup is O(1) and reads exactly one byte range.
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.index = load_index(shard_dir)
+        self._lookup = {int(ts): i for i, ts in enumerate(self.index["timestamp"])}
+        self._files = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, timestamp):
+        return int(timestamp) in self._lookup
+
+    def timestamps(self):
+        return np.sort(self.index["timestamp"])
+
+    def read(self, timestamp):
+        """
+        Returns the encoded PNG bytes of the image at `timestamp`.
+        """
+        entry = self.index[self._lookup[int(timestamp)]]
+        shard = int(entry["shard"])
+        if shard not in self._files:
+            self._files[shard] = open(shard_path(self.shard_dir, shard), "rb")
+        f = self._files[shard]
+        f.seek(int(entry["offset"]))
+        return f.read(int(entry["size"]))
+
+    def load(self, timestamp):
+        """
+        Returns the decoded image at `timestamp` as an array.
+        """
+        return np.asarray(Image.open(io.BytesIO(self.read(timestamp))))
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,50 @@
+import os
+import glob
+import tarfile
+
+from src.settings import RAW_DIR
+
+
+def find_tars(traverse, camera, raw_dir=RAW_DIR):
+    """
+    Returns the sorted chunk archives downloaded by the scraper for a
+    traverse/camera pair and left unextracted (scrape_mrgdatashare.py
+    --no_extract), e.g. 2015-03-24-13-47-33_stereo_centre_01.tar.
+    """
+    pattern = "{}_{}_*.tar".format(traverse, camera.replace("/", "_"))
+    return sorted(glob.glob(os.path.join(raw_dir, pattern)))
+
+
+def _is_image(member):
+    return member.isfile() and member.name.endswith(".png")
+
+
+def list_tar_images(tar_paths):
+    """
+    Returns the file names (<timestamp>.png) of all images in the archives.
+    Only the tar headers are read, the image data is skipped over.
+    """
+    fnames = []
+    for tar_path in tar_paths:
+        with tarfile.open(tar_path, "r:") as tar:
+            fnames += [os.path.basename(member.name) for member in tar if _is_image(member)]
+    return fnames
+
+
+def tar_timestamps(tar_paths):
+    return sorted(int(fname[:-4]) for fname in list_tar_images(tar_paths))
+
+
+def read_tar_images(tar_path, fnames=None):
+    """
+    Yields (data, fname) for the raw images in an archive in archive order, so
+    each archive is read sequentially and images are decoded from memory
+    without being extracted to disk. If `fnames` is given, images not in it
+    are skipped without reading their data.
+    """
+    with tarfile.open(tar_path, "r:") as tar:
+        for member in tar:
+            fname = os.path.basename(member.name)
+            if not _is_image(member) or (fnames is not None and fname not in fnames):
+                continue
+            yield tar.extractfile(member).read(), fname
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+from src.settings import RAW_DIR
+
+
+def find_timestamps_file(traverse, camera, raw_dir=RAW_DIR):
+    """
+    Returns the path of the .timestamps file of a camera, e.g.
+    RAW_DIR/<traverse>/stereo.timestamps for stereo/centre, which the dataset
+    places either next to or one level above the image folder, or None if
+    there is none.
+    """
+    sensor = camera.split("/")[0]
+    for path in [os.path.join(raw_dir, traverse, camera, os.pardir, sensor + ".timestamps"),
+                 os.path.join(raw_dir, traverse, sensor + ".timestamps")]:
+        if os.path.isfile(path):
+            return os.path.normpath(path)
+    return None
+
+
+def load_timestamps(path):
+    """
+    Returns the timestamps of a .timestamps file and the chunk column that
+    follows each timestamp, or None for the chunks if the file has none.
+    """
+    rows = np.loadtxt(path, dtype=np.int64, ndmin=2)
+    return rows[:, 0], (rows[:, 1] if rows.shape[1] > 1 else None)
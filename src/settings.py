@@ -1,5 +1,6 @@
 RAW_DIR = "/work/qvpr/data/raw/RobotCar/"
 READY_DIR = "/work/qvpr/data/ready/RobotCar/"
 PROCESSED_DIR = "/work/qvpr/data/processed/RobotCar/"
+CACHE_DIR = "/work/qvpr/data/processed/RobotCar/cache/"
 
 camera_names = ["stereo/left", "stereo/right", "stereo/centre", "mono_left", "mono_right", "mono_rear"]
@@ -695,6 +695,11 @@ if __name__ == "__main__":
         default=default_nb_tries_reconnection,
         help="Number of downloading tries for a file  e.g. " +
              str(default_nb_tries_reconnection))
+    argument_parser.add_argument(
+        "--no_extract",
+        dest="no_extract",
+        action="store_true",
+        help="Keep downloaded tar files instead of extracting them, e.g. for reading images straight from the archives")
 
     # parse CL
     args = argument_parser.parse_args()
@@ -740,7 +745,7 @@ if __name__ == "__main__":
                     time.sleep(args.reconnection_duration)
 
             # unzip
-            if file_was_found:
+            if file_was_found and not args.no_extract:
                 zipper.unzip(url_handler)
 
         # tidy up
@@ -17,7 +17,8 @@ import re
 import numpy as np
 
 from transform import build_se3_transform
-from interpolate_poses import interpolate_vo_poses, interpolate_ins_poses
+from interpolate_poses import interpolate_vo_poses, interpolate_ins_poses_array
+from time_index import TimeIndex
 from velodyne import load_velodyne_raw, load_velodyne_binary, velodyne_raw_to_pointcloud
 
 
@@ -47,12 +48,8 @@ def build_pointcloud(lidar_dir, poses_file, extrinsics_dir, start_time, end_time
     lidar = re.search('(lms_front|lms_rear|ldmrs|velodyne_left|velodyne_right)', lidar_dir).group(0)
     timestamps_path = os.path.join(lidar_dir, os.pardir, lidar + '.timestamps')
 
-    timestamps = []
-    with open(timestamps_path) as timestamps_file:
-        for line in timestamps_file:
-            timestamp = int(line.split(' ')[0])
-            if start_time <= timestamp <= end_time:
-                timestamps.append(timestamp)
+    # QUT CHANGE: seek to the window through the time index instead of reading the whole timestamps file
+    timestamps = TimeIndex(timestamps_path).timestamps(start_time, end_time).tolist()
 
     if len(timestamps) == 0:
         raise ValueError("No LIDAR data in the given time bracket.")
@@ -69,7 +66,9 @@ def build_pointcloud(lidar_dir, poses_file, extrinsics_dir, start_time, end_time
             G_posesource_laser = np.linalg.solve(build_se3_transform([float(x) for x in extrinsics.split(' ')]),
                                                  G_posesource_laser)
 
-        poses = interpolate_ins_poses(poses_file, timestamps, origin_time, use_rtk=(poses_type == 'rtk'))
+        # QUT CHANGE: interpolated INS poses are absolute, so express them relative to the pose at the origin time
+        poses = interpolate_ins_poses_array(poses_file, [origin_time] + timestamps, use_rtk=(poses_type == 'rtk'))
+        poses = np.linalg.inv(poses[0]) @ poses[1:]
     else:
         # sensor is VO, which is located at the main vehicle frame
         poses = interpolate_vo_poses(poses_file, timestamps, origin_time)
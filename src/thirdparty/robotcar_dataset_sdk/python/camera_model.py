@@ -14,9 +14,22 @@
 
 import re
 import os
+import hashlib
 import numpy as np
+import cv2
 import scipy.interpolate as interp
 from scipy.ndimage import map_coordinates
+from .time_index import atomic_save
+
+# QUT CHANGE: undistortion backends selectable through `CameraModel.undistort`.
+#   'map_coordinates': original per-channel scipy implementation (float64 coordinates).
+#   'remap': single interleaved cv2.remap pass over all channels with cached float32 maps.
+#   'remap_fixed': as 'remap' but with maps converted to OpenCV's fixed-point (int16) format.
+# Both remap backends use OpenCV's bilinear interpolation, which quantises sub-pixel offsets to 1/32 pixel. Where the
+# LUT samples inside the distorted image their output differs from 'map_coordinates' by at most 1 intensity level.
+# Where the LUT samples less than one pixel outside the distorted image, OpenCV blends with a zero border while scipy
+# does not, so these (few) edge pixels may differ further.
+UNDISTORT_METHODS = ('map_coordinates', 'remap', 'remap_fixed')
 
 
 class CameraModel:
@@ -31,14 +44,21 @@ class CameraModel:
         bilinear_lut (:obj: `numpy.ndarray`): Look-up table for undistortion of images, mapping pixels in an undistorted
             image to pixels in the distorted image
 
+    QUT CHANGE: the coordinate arrays used by each undistortion backend are built from `bilinear_lut` on first use and
+    cached on the model, rather than being rebuilt for every image. Arrays that are memory-mapped (see
+    `share_memory`) are pickled by file name, so copies of the model in other processes attach to the same pages.
+    If a cache directory is given, the intrinsics, LUT and undistortion maps are persisted there as .npy files keyed
+    by model name and a hash of the model files, and are memory-mapped by every later model built from them.
+
     """
 
-    def __init__(self, models_dir, images_dir):
+    def __init__(self, models_dir, images_dir, cache_dir=None):
         """Loads a camera model from disk.
 
         Args:
             models_dir (str): directory containing camera model files.
             images_dir (str): directory containing images for which to read camera model.
+            cache_dir (str): (optional) directory for the persistent model cache. QUT CHANGE: added argument.
 
         """
         self.camera = None
@@ -47,9 +67,49 @@ class CameraModel:
         self.principal_point = None
         self.G_camera_image = None
         self.bilinear_lut = None
+        self._undistort_maps = {}
+        self._cache_prefix = None
+
+        if cache_dir:
+            self.__load_cached(models_dir, images_dir, cache_dir)
+        else:
+            self.__load_intrinsics(models_dir, images_dir)
+            self.__load_lut(models_dir, images_dir)
+
+    def __getstate__(self):
+        # QUT CHANGE: memory-mapped arrays are pickled by file name. Other cached undistortion maps are derived from
+        # `bilinear_lut`, so are rebuilt rather than pickled.
+        state = self.__dict__.copy()
+        state['bilinear_lut'] = _pickle_mapped(self.bilinear_lut)
+        state['_undistort_maps'] = {key: _pickle_mapped(maps) for key, maps in self._undistort_maps.items()
+                                    if _is_mapped(maps)}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bilinear_lut = _unpickle_mapped(self.bilinear_lut)
+        self._undistort_maps = {key: _unpickle_mapped(maps) for key, maps in self._undistort_maps.items()}
+
+    def share_memory(self, share_dir):
+        """Moves the LUT and all cached undistortion maps into memory-mapped files.
+
+        QUT CHANGE: added function. Intended for worker pools: build the maps needed with `undistort_maps`, call this
+        with a directory on a RAM backed filesystem (e.g. /dev/shm), then pass the model to the workers. Each worker
+        maps the same files instead of receiving and holding its own copy of the arrays.
 
-        self.__load_intrinsics(models_dir, images_dir)
-        self.__load_lut(models_dir, images_dir)
+        Args:
+            share_dir (str): existing directory in which to write the arrays. Must outlive any users of the model.
+
+        """
+        self.bilinear_lut = _save_cached(os.path.join(share_dir, 'bilinear_lut.npy'), self.bilinear_lut)
+        for (method, (rows, cols)), maps in self._undistort_maps.items():
+            name = '{}_{}x{}'.format(method, rows, cols)
+            if isinstance(maps, tuple):
+                maps = tuple(_save_cached(os.path.join(share_dir, '{}_{}.npy'.format(name, i)), m)
+                             for i, m in enumerate(maps))
+            else:
+                maps = _save_cached(os.path.join(share_dir, name + '.npy'), maps)
+            self._undistort_maps[(method, (rows, cols))] = maps
 
     def project(self, xyz, image_size):
         """Projects a pointcloud into the camera using a pinhole camera model.
@@ -83,11 +143,13 @@ class CameraModel:
 
         return uv[:, in_img], np.ravel(xyzw[2, in_img])
 
-    def undistort(self, image):
+    def undistort(self, image, method='map_coordinates'):
         """Undistorts an image.
 
         Args:
             image (:obj: `numpy.ndarray`): A distorted image. Must be demosaiced - ie. must be a 3-channel RGB image.
+                QUT CHANGE: may also be a half resolution (superpixel demosaiced) image.
+            method (str): undistortion backend, one of `UNDISTORT_METHODS`. QUT CHANGE: added argument.
 
         Returns:
             numpy.ndarray: Undistorted version of image.
@@ -95,20 +157,92 @@ class CameraModel:
         Raises:
             ValueError: if image size does not match camera model.
             ValueError: if image only has a single channel.
+            ValueError: if method is not a known undistortion backend.
 
         """
-        if image.shape[0] * image.shape[1] != self.bilinear_lut.shape[0]:
-            raise ValueError('Incorrect image size for camera model')
+        if method not in UNDISTORT_METHODS:
+            raise ValueError('Unknown undistortion method: ' + str(method))
 
-        lut = self.bilinear_lut[:, 1::-1].T.reshape((2, image.shape[0], image.shape[1]))
+        if image.shape[0] * image.shape[1] not in (self.bilinear_lut.shape[0], self.bilinear_lut.shape[0] // 4):
+            raise ValueError('Incorrect image size for camera model')
 
         if len(image.shape) == 1:
             raise ValueError('Undistortion function only works with multi-channel images')
 
-        undistorted = np.rollaxis(np.array([map_coordinates(image[:, :, channel], lut, order=1)
-                                for channel in range(0, image.shape[2])]), 0, 3)
+        dtype = image.dtype
+        if method == 'map_coordinates':
+            lut = self.undistort_maps(image.shape[:2], method)
+            undistorted = np.rollaxis(np.array([map_coordinates(image[:, :, channel], lut, order=1)
+                                    for channel in range(0, image.shape[2])]), 0, 3)
+        else:
+            map1, map2 = self.undistort_maps(image.shape[:2], method)
+            if image.dtype == np.float64:
+                # cv2.remap does not support double precision images
+                image = image.astype(np.float32)
+            undistorted = cv2.remap(image, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+        return undistorted.astype(dtype)
+
+    def undistort_maps(self, image_size, method='map_coordinates'):
+        """Returns the cached coordinate maps used by an undistortion backend, building them on first use.
+
+        QUT CHANGE: added function.
+
+        Args:
+            image_size (tuple[int]): (rows, columns) of the images to be undistorted. Either the full resolution of the
+                camera or half of it in each dimension.
+            method (str): undistortion backend, one of `UNDISTORT_METHODS`.
+
+        Returns:
+            numpy.ndarray: 2 x rows x columns array of (row, column) coordinates for 'map_coordinates', or
+            tuple[numpy.ndarray]: pair of maps in the format expected by `cv2.remap` for the remap backends.
+
+        """
+        key = (method, tuple(image_size))
+        if key in self._undistort_maps:
+            return self._undistort_maps[key]
+
+        if self._cache_prefix:
+            name = '{}_{}_{}x{}'.format(self._cache_prefix, method, *image_size)
+            paths = [name + '.npy'] if method == 'map_coordinates' else [name + '_0.npy', name + '_1.npy']
+            if all(os.path.isfile(path) for path in paths):
+                maps = tuple(np.load(path, mmap_mode='r') for path in paths)
+                self._undistort_maps[key] = maps[0] if len(maps) == 1 else maps
+                return self._undistort_maps[key]
+
+        map_x, map_y = self.__lut_maps(image_size)
+        if method == 'map_coordinates':
+            maps = np.stack((map_y, map_x))
+        else:
+            map_x = map_x.astype(np.float32)
+            map_y = map_y.astype(np.float32)
+            if method == 'remap_fixed':
+                maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+            else:
+                maps = (map_x, map_y)
 
-        return undistorted.astype(image.dtype)
+        if self._cache_prefix:
+            if isinstance(maps, tuple):
+                maps = tuple(_save_cached(path, m) for path, m in zip(paths, maps))
+            else:
+                maps = _save_cached(paths[0], maps)
+        self._undistort_maps[key] = maps
+        return maps
+
+    def __lut_maps(self, image_size):
+        rows, cols = image_size
+        if rows * cols == self.bilinear_lut.shape[0]:
+            map_x = self.bilinear_lut[:, 0].reshape((rows, cols))
+            map_y = self.bilinear_lut[:, 1].reshape((rows, cols))
+        elif 4 * rows * cols == self.bilinear_lut.shape[0]:
+            # Half resolution pixel i is centred on full resolution coordinate 2i + 0.5, so average the LUT over each
+            # 2x2 block and map the distorted full resolution coordinate x back to (x - 0.5) / 2.
+            lut = self.bilinear_lut.reshape((rows, 2, cols, 2, 2)).mean(axis=(1, 3))
+            map_x = (lut[:, :, 0] - 0.5) / 2
+            map_y = (lut[:, :, 1] - 0.5) / 2
+        else:
+            raise ValueError('Incorrect image size for camera model')
+        return map_x, map_y
 
     def __get_model_name(self, images_dir):
         self.camera = re.search('(stereo|mono_(left|right|rear))', images_dir).group(0)
@@ -139,6 +273,33 @@ class CameraModel:
                 G_camera_image.append([float(x) for x in line.split()])
             self.G_camera_image = np.array(G_camera_image)
 
+    def __load_cached(self, models_dir, images_dir, cache_dir):
+        model_name = self.__get_model_name(images_dir)
+        intrinsics_path = os.path.join(models_dir, model_name + '.txt')
+        lut_path = os.path.join(models_dir, model_name + '_distortion_lut.bin')
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self._cache_prefix = os.path.join(cache_dir, model_name + '_' + _hash_files([intrinsics_path, lut_path]))
+
+        # intrinsics are stored as a 5x4 array: focal length and principal point, followed by G_camera_image
+        cached_intrinsics_path = self._cache_prefix + '_intrinsics.npy'
+        if os.path.isfile(cached_intrinsics_path):
+            intrinsics = np.load(cached_intrinsics_path)
+            self.focal_length = (float(intrinsics[0, 0]), float(intrinsics[0, 1]))
+            self.principal_point = (float(intrinsics[0, 2]), float(intrinsics[0, 3]))
+            self.G_camera_image = intrinsics[1:]
+        else:
+            self.__load_intrinsics(models_dir, images_dir)
+            _save_cached(cached_intrinsics_path,
+                         np.vstack((self.focal_length + self.principal_point, self.G_camera_image)))
+
+        cached_lut_path = self._cache_prefix + '_bilinear_lut.npy'
+        if os.path.isfile(cached_lut_path):
+            self.bilinear_lut = np.load(cached_lut_path, mmap_mode='r')
+        else:
+            self.__load_lut(models_dir, images_dir)
+            self.bilinear_lut = _save_cached(cached_lut_path, self.bilinear_lut)
+
     def __load_lut(self, models_dir, images_dir):
         model_name = self.__get_model_name(images_dir)
         lut_path = os.path.join(models_dir, model_name + '_distortion_lut.bin')
@@ -147,3 +308,45 @@ class CameraModel:
         lut = lut.reshape([2, lut.size // 2])
         self.bilinear_lut = lut.transpose()
 
+
+
+# hashes of model files, keyed by (path, size, modification time), so each file is only hashed once per process
+_file_hashes = {}
+
+
+def _hash_files(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in _file_hashes:
+            file_digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    file_digest.update(block)
+            _file_hashes[key] = file_digest.hexdigest()
+        digest.update(_file_hashes[key].encode())
+    return digest.hexdigest()[:16]
+
+
+def _save_cached(path, array):
+    atomic_save(path, array)
+    return np.load(path, mmap_mode='r')
+
+
+def _is_mapped(maps):
+    if isinstance(maps, tuple):
+        return all(_is_mapped(m) for m in maps)
+    return isinstance(maps, np.memmap) and maps.filename is not None
+
+
+def _pickle_mapped(maps):
+    if isinstance(maps, tuple):
+        return tuple(_pickle_mapped(m) for m in maps)
+    return maps.filename if _is_mapped(maps) else maps
+
+
+def _unpickle_mapped(maps):
+    if isinstance(maps, tuple):
+        return tuple(_unpickle_mapped(m) for m in maps)
+    return np.load(maps, mmap_mode='r') if isinstance(maps, str) else maps
@@ -20,13 +20,122 @@ import numpy as np
 BAYER_STEREO = 'gbrg'
 BAYER_MONO = 'rggb'
 
+# QUT CHANGE: demosaicing backends selectable through `load_image`.
+#   'colour': original colour_demosaicing bilinear implementation (float64).
+#   'bilinear_int': same bilinear filter evaluated in integer arithmetic. Identical output to 'colour' after the uint8
+#       conversion in `load_image`, without any float64 full frame buffers.
+#   'superpixel': collapses each 2x2 Bayer cell into one RGB pixel, giving a half resolution image.
+DEMOSAIC_METHODS = ('colour', 'bilinear_int', 'superpixel')
 
-def load_image(image_path, model=None):
+# bilinear interpolation kernels (scaled by 4 to keep integer weights) for the green and red/blue channels
+_KERNEL_G = ((0, 1, 0),
+             (1, 4, 1),
+             (0, 1, 0))
+_KERNEL_RB = ((1, 2, 1),
+              (2, 4, 2),
+              (1, 2, 1))
+
+
+def _accumulator_dtype(dtype):
+    if dtype == np.uint8:
+        return np.uint16
+    elif dtype == np.uint16:
+        return np.uint32
+    raise ValueError('Integer demosaicing requires a uint8 or uint16 image, got ' + str(dtype))
+
+
+def _channel_offsets(pattern):
+    """Returns the (row, column) offsets within a 2x2 Bayer cell of each sample of each channel."""
+    pattern = pattern.lower()
+    if sorted(pattern) != ['b', 'g', 'g', 'r']:
+        raise ValueError('Unknown Bayer pattern: ' + pattern)
+    offsets = {'r': [], 'g': [], 'b': []}
+    for i, channel in enumerate(pattern):
+        offsets[channel].append((i // 2, i % 2))
+    return offsets
+
+
+def demosaic_bilinear_int(raw, pattern):
+    """Bilinear demosaicing of a Bayer image in integer arithmetic.
+
+    QUT CHANGE: added function.
+
+    Args:
+        raw (:obj: `numpy.ndarray`): single channel uint8 or uint16 Bayer image.
+        pattern (str): Bayer pattern of the image, e.g. 'gbrg' or 'rggb'.
+
+    Returns:
+        numpy.ndarray: demosaiced RGB image with the same dtype as `raw`. Equal to the truncated output of
+        `colour_demosaicing.demosaicing_CFA_Bayer_bilinear`, including its reflected image borders.
+
+    """
+    raw = np.asarray(raw)
+    acc_dtype = _accumulator_dtype(raw.dtype)
+    offsets = _channel_offsets(pattern)
+    rows, cols = raw.shape
+
+    rgb = np.empty((rows, cols, 3), raw.dtype)
+    acc = np.empty((rows, cols), acc_dtype)
+    for channel, kernel in enumerate((_KERNEL_RB, _KERNEL_G, _KERNEL_RB)):
+        plane = np.zeros((rows, cols), acc_dtype)
+        for row, col in offsets['rgb'[channel]]:
+            plane[row::2, col::2] = raw[row::2, col::2]
+        plane = np.pad(plane, 1, mode='symmetric')
+
+        acc.fill(0)
+        for i in range(3):
+            for j in range(3):
+                if kernel[i][j]:
+                    window = plane[i:i + rows, j:j + cols]
+                    acc += window if kernel[i][j] == 1 else window * acc_dtype(kernel[i][j])
+        np.right_shift(acc, 2, out=acc)
+        rgb[:, :, channel] = acc
+    return rgb
+
+
+def demosaic_superpixel(raw, pattern):
+    """Half resolution demosaicing of a Bayer image, collapsing each 2x2 cell into a single RGB pixel.
+
+    QUT CHANGE: added function.
+
+    Args:
+        raw (:obj: `numpy.ndarray`): single channel uint8 or uint16 Bayer image with even dimensions.
+        pattern (str): Bayer pattern of the image, e.g. 'gbrg' or 'rggb'.
+
+    Returns:
+        numpy.ndarray: RGB image with half the rows and columns of `raw` and the same dtype. The green channel is the
+        rounded mean of the two green samples in each cell.
+
+    """
+    raw = np.asarray(raw)
+    acc_dtype = _accumulator_dtype(raw.dtype)
+    offsets = _channel_offsets(pattern)
+    rows, cols = raw.shape
+    if rows % 2 or cols % 2:
+        raise ValueError('Superpixel demosaicing requires even image dimensions')
+
+    rgb = np.empty((rows // 2, cols // 2, 3), raw.dtype)
+    (r_row, r_col), = offsets['r']
+    (b_row, b_col), = offsets['b']
+    (g1_row, g1_col), (g2_row, g2_col) = offsets['g']
+    rgb[:, :, 0] = raw[r_row::2, r_col::2]
+    rgb[:, :, 2] = raw[b_row::2, b_col::2]
+    green = raw[g1_row::2, g1_col::2].astype(acc_dtype)
+    green += raw[g2_row::2, g2_col::2]
+    green += 1
+    rgb[:, :, 1] = green >> 1
+    return rgb
+
+
+def load_image(image_path, model=None, undistort_method='map_coordinates', demosaic_method='colour'):
     """Loads and rectifies an image from file.
 
     Args:
         image_path (str): path to an image from the dataset.
         model (camera_model.CameraModel): if supplied, model will be used to undistort image.
+        undistort_method (str): undistortion backend passed to `CameraModel.undistort`. QUT CHANGE: added argument.
+        demosaic_method (str): demosaicing backend, one of `DEMOSAIC_METHODS`. 'superpixel' returns a half
+            resolution image. QUT CHANGE: added argument.
 
     Returns:
         numpy.ndarray: demosaiced and optionally undistorted image
@@ -42,9 +151,16 @@ def load_image(image_path, model=None):
         pattern = BAYER_MONO
 
     img = Image.open(image_path)
-    img = demosaic(img, pattern)
+    if demosaic_method == 'colour':
+        img = demosaic(img, pattern)
+    elif demosaic_method == 'bilinear_int':
+        img = demosaic_bilinear_int(np.asarray(img), pattern)
+    elif demosaic_method == 'superpixel':
+        img = demosaic_superpixel(np.asarray(img), pattern)
+    else:
+        raise ValueError('Unknown demosaicing method: ' + str(demosaic_method))
     if model:
-        img = model.undistort(img)
+        img = model.undistort(img, undistort_method)
 
     return np.array(img).astype(np.uint8)
 
@@ -13,10 +13,16 @@
 ################################################################################
 
 import bisect
-import csv
 import numpy as np
 import numpy.matlib as ml
 from .transform import *
+from .time_index import cached_array
+
+# QUT CHANGE: columns read from each pose log by `load_pose_log`, the timestamp followed by x, y, z, roll, pitch, yaw.
+# The Euler angles of ins.csv are its last three columns, which are appended in `load_ins_poses`.
+VO_COLUMNS = (0, 2, 3, 4, 5, 6, 7)
+INS_COLUMNS = (0, 5, 6, 7)
+RTK_COLUMNS = (0, 4, 5, 6, 11, 12, 13)
 
 
 def interpolate_vo_poses(vo_path, pose_timestamps, origin_timestamp):
@@ -26,35 +32,31 @@ def interpolate_vo_poses(vo_path, pose_timestamps, origin_timestamp):
         pose_timestamps (list[int]): UNIX timestamps at which interpolated poses are required.
         origin_timestamp (int): UNIX timestamp of origin frame. Poses will be reported relative to this frame.
     Returns:
-        list[numpy.matrixlib.defmatrix.matrix]: SE3 matrix representing interpolated pose for each requested timestamp.
+        numpy.ndarray: SE3 matrix representing interpolated pose for each requested timestamp, shape (N, 4, 4).
+    QUT CHANGE: Vectorised. Rows are read from the binary pose log cache, see `load_pose_log`, the relative poses in
+    the requested window are built in one batch and accumulated with `cumulative_se3`, and the absolute poses are
+    interpolated with `interpolate_se3_array`. Returns an array instead of a list of matrices.
     """
-    with open(vo_path) as vo_file:
-        vo_reader = csv.reader(vo_file)
-        headers = next(vo_file)
-
-        vo_timestamps = [0]
-        abs_poses = [ml.identity(4)]
-
-        lower_timestamp = min(min(pose_timestamps), origin_timestamp)
-        upper_timestamp = max(max(pose_timestamps), origin_timestamp)
-
-        for row in vo_reader:
-            timestamp = int(row[0])
-            if timestamp < lower_timestamp:
-                vo_timestamps[0] = timestamp
-                continue
+    vo_log_timestamps, vo_log_xyzrpy = load_pose_log(vo_path, VO_COLUMNS)
 
-            vo_timestamps.append(timestamp)
+    lower_timestamp = min(min(pose_timestamps), origin_timestamp)
+    upper_timestamp = max(max(pose_timestamps), origin_timestamp)
 
-            xyzrpy = [float(v) for v in row[2:8]]
-            rel_pose = build_se3_transform(xyzrpy)
-            abs_pose = abs_poses[-1] * rel_pose
-            abs_poses.append(abs_pose)
+    # the last row before the window only provides the timestamp of the identity pose the window starts from. The
+    # window ends at the first row at or after upper_timestamp, or at the end of the log if there is none
+    start = np.searchsorted(vo_log_timestamps, lower_timestamp, side='left')
+    stop = max(np.searchsorted(vo_log_timestamps, upper_timestamp, side='left') + 1, start)
+    stop = min(stop, len(vo_log_timestamps))
+    vo_timestamps = np.empty(stop - start + 1, dtype=np.int64)
+    vo_timestamps[0] = vo_log_timestamps[start - 1] if start > 0 else 0
+    vo_timestamps[1:] = vo_log_timestamps[start:stop]
 
-            if timestamp >= upper_timestamp:
-                break
+    abs_poses = np.empty((len(vo_timestamps), 4, 4))
+    abs_poses[0] = np.identity(4)
+    abs_poses[1:] = cumulative_se3(build_se3_transform(np.asarray(vo_log_xyzrpy[start:stop]).reshape(-1, 6)))
 
-    return interpolate_poses(vo_timestamps, abs_poses, pose_timestamps, origin_timestamp)
+    poses = interpolate_se3_array(vo_timestamps, abs_poses, [origin_timestamp] + list(pose_timestamps))
+    return np.linalg.inv(poses[0]) @ poses[1:]
 
 
 def interpolate_ins_poses(ins_path, pose_timestamps, use_rtk=False):
@@ -66,30 +68,24 @@ def interpolate_ins_poses(ins_path, pose_timestamps, use_rtk=False):
         list[numpy.matrixlib.defmatrix.matrix]: SE3 matrix representing interpolated pose for each requested timestamp.
     QUT CHANGE: Removed origin timestamp, so interpolated poses are absolute
     """
-    with open(ins_path) as ins_file:
-        ins_reader = csv.reader(ins_file)
-        headers = next(ins_file)
+    # QUT CHANGE: rows are read from the binary pose log cache, see `load_ins_poses`, starting from the last row
+    # before the requested window instead of the start of the log
+    ins_log_timestamps, ins_log_xyzrpy = load_ins_poses(ins_path, use_rtk)
+    window = pose_window(ins_log_timestamps, min(pose_timestamps), max(pose_timestamps))
 
-        ins_timestamps = [0]
-        abs_poses = [ml.identity(4)]
+    ins_timestamps = []
+    abs_poses = []
 
-        upper_timestamp = max(pose_timestamps)
+    upper_timestamp = max(pose_timestamps)
 
-        for row in ins_reader:
-            timestamp = int(row[0])
-            ins_timestamps.append(timestamp)
+    for timestamp, xyzrpy in zip(ins_log_timestamps[window].tolist(), ins_log_xyzrpy[window]):
+        ins_timestamps.append(timestamp)
 
-            utm = row[5:8] if not use_rtk else row[4:7]
-            rpy = row[-3:] if not use_rtk else row[11:14]
-            xyzrpy = [float(v) for v in utm] + [float(v) for v in rpy]
-            abs_pose = build_se3_transform(xyzrpy)
-            abs_poses.append(abs_pose)
+        abs_pose = build_se3_transform(xyzrpy)
+        abs_poses.append(abs_pose)
 
-            if timestamp >= upper_timestamp:
-                break
-
-    ins_timestamps = ins_timestamps[1:]
-    abs_poses = abs_poses[1:]
+        if timestamp >= upper_timestamp:
+            break
 
     return interpolate_poses(ins_timestamps, abs_poses, pose_timestamps)
 
@@ -128,8 +124,13 @@ def interpolate_poses(pose_timestamps, abs_poses, requested_timestamps):
     if max(upper_indices) >= len(pose_timestamps):
         upper_indices = [min(i, len(pose_timestamps) - 1) for i in upper_indices]
 
-    fractions = (requested_timestamps - pose_timestamps[lower_indices]) // \
-                (pose_timestamps[upper_indices] - pose_timestamps[lower_indices])
+    # QUT CHANGE: true division instead of floor division, so poses between two samples are interpolated rather
+    # than taken from the earlier sample, as in `interpolate_poses_array`. Requests clamped to the last pose have a
+    # zero interval and take that pose
+    intervals = pose_timestamps[upper_indices] - pose_timestamps[lower_indices]
+    fractions = np.zeros(len(requested_timestamps))
+    bracketed = intervals > 0
+    fractions[bracketed] = (requested_timestamps - pose_timestamps[lower_indices])[bracketed] / intervals[bracketed]
 
     quaternions_lower = abs_quaternions[:, lower_indices]
     quaternions_upper = abs_quaternions[:, upper_indices]
@@ -195,3 +196,181 @@ def interpolate_poses(pose_timestamps, abs_poses, requested_timestamps):
         poses_out[i] = np.asarray(poses_mat[0:4, i * 4:(i + 1) * 4])
 
     return poses_out
+
+
+def load_ins_poses(ins_path, use_rtk=False):
+    """Loads all poses from an INS or RTK file.
+
+    QUT CHANGE: added function. Reads the needed columns through the binary pose log cache, see `load_pose_log`.
+
+    Args:
+        ins_path (str): path to file containing poses from INS.
+        use_rtk (bool): whether the file is an RTK file (rtk.csv) rather than INS (ins.csv).
+
+    Returns:
+        numpy.ndarray: UNIX timestamps of the poses, shape (N,).
+        numpy.ndarray: [x, y, z, roll, pitch, yaw] of each pose, shape (N, 6).
+
+    """
+    if use_rtk:
+        columns = RTK_COLUMNS
+    else:
+        # roll, pitch and yaw are the last three columns
+        with open(ins_path) as ins_file:
+            n_columns = len(next(ins_file).split(','))
+        columns = INS_COLUMNS + tuple(range(n_columns - 3, n_columns))
+    return load_pose_log(ins_path, columns)
+
+
+def load_pose_log(path, columns):
+    """Loads timestamps and pose components from a pose log (vo.csv, ins.csv or rtk.csv) through a binary cache.
+
+    QUT CHANGE: added function. The first time a log is read, the requested columns are parsed in bulk and cached
+    as a .npy file next to the log, see `time_index.cached_array`. Later reads memory-map the .npy file instead of
+    parsing the text.
+
+    Args:
+        path (str): path to the pose log.
+        columns (tuple[int]): column of the timestamp followed by the columns of the pose components.
+
+    Returns:
+        numpy.ndarray: UNIX timestamps, shape (N,).
+        numpy.ndarray: pose components, shape (N, len(columns) - 1).
+
+    """
+    dtype = [('timestamp', np.int64), ('values', np.float64, (len(columns) - 1,))]
+    poses = cached_array(path, '-'.join(str(c) for c in columns), lambda path: np.loadtxt(
+        path, delimiter=',', skiprows=1, usecols=columns, dtype=dtype, ndmin=1))
+    return poses['timestamp'], poses['values']
+
+
+def interpolate_ins_poses_array(ins_path, pose_timestamps, use_rtk=False):
+    """Interpolate poses from INS for many timestamps at once.
+
+    QUT CHANGE: added function. Vectorised equivalent of `interpolate_ins_poses`, see `interpolate_poses_array`.
+
+    Args:
+        ins_path (str): path to file containing poses from INS.
+        pose_timestamps (list[int]): UNIX timestamps at which interpolated poses are required.
+        use_rtk (bool): whether the file is an RTK file (rtk.csv) rather than INS (ins.csv).
+
+    Returns:
+        numpy.ndarray: SE3 matrices of the interpolated pose for each requested timestamp, shape (N, 4, 4).
+
+    """
+    ins_timestamps, xyzrpy = load_ins_poses(ins_path, use_rtk)
+    pose_timestamps = np.asarray(pose_timestamps, dtype=np.int64)
+    window = pose_window(ins_timestamps, pose_timestamps.min(), pose_timestamps.max())
+    return interpolate_poses_array(ins_timestamps[window], xyzrpy[window], pose_timestamps)
+
+
+def pose_window(timestamps, lower_timestamp, upper_timestamp):
+    """Finds the rows of a pose log needed to interpolate poses within a time window.
+
+    QUT CHANGE: added function. Binary searches the (memory-mapped) timestamps of a pose log, so only the rows
+    bracketing the window are read.
+
+    Args:
+        timestamps (numpy.ndarray): timestamps of the pose log, in ascending order.
+        lower_timestamp (int): UNIX timestamp of the start of the window.
+        upper_timestamp (int): UNIX timestamp of the end of the window.
+
+    Returns:
+        slice: rows from the last pose at or before the window to the first pose after it.
+
+    """
+    start = max(np.searchsorted(timestamps, lower_timestamp, side='right') - 1, 0)
+    stop = np.searchsorted(timestamps, upper_timestamp, side='right') + 1
+    return slice(int(start), int(stop))
+
+
+def interpolate_poses_array(pose_timestamps, xyzrpy, requested_timestamps):
+    """Interpolate between absolute poses given as translations and Euler angles, for many timestamps at once.
+
+    QUT CHANGE: added function. Vectorised equivalent of `interpolate_poses`: poses are converted to quaternions in
+    one batch, the bracketing poses of every requested timestamp are found with a single `searchsorted` and the
+    slerp is evaluated over arrays. Timestamps outside the supplied poses are clamped to the first or last pose.
+
+    Args:
+        pose_timestamps (list[int]): Timestamps of supplied poses. Must be in ascending order.
+        xyzrpy (numpy.ndarray): [x, y, z, roll, pitch, yaw] of the pose at each timestamp, shape (M, 6).
+        requested_timestamps (list[int]): Timestamps for which interpolated timestamps are required.
+
+    Returns:
+        numpy.ndarray: SE3 matrices of the interpolated pose for each requested timestamp, shape (N, 4, 4).
+
+    Raises:
+        ValueError: if pose_timestamps and xyzrpy are not the same length
+        ValueError: if pose_timestamps is not in ascending order
+
+    """
+    xyzrpy = np.asarray(xyzrpy, dtype=float)
+    return _slerp_poses(pose_timestamps, xyzrpy[:, 0:3], euler_to_quaternion(xyzrpy[:, 3:6]), requested_timestamps)
+
+
+def interpolate_se3_array(pose_timestamps, abs_poses, requested_timestamps):
+    """Interpolate between absolute poses given as SE3 matrices, for many timestamps at once.
+
+    QUT CHANGE: added function. As `interpolate_poses_array`, for poses given as matrices.
+
+    Args:
+        pose_timestamps (list[int]): Timestamps of supplied poses. Must be in ascending order.
+        abs_poses (numpy.ndarray): SE3 matrices of the pose at each timestamp, shape (M, 4, 4).
+        requested_timestamps (list[int]): Timestamps for which interpolated timestamps are required.
+
+    Returns:
+        numpy.ndarray: SE3 matrices of the interpolated pose for each requested timestamp, shape (N, 4, 4).
+
+    Raises:
+        ValueError: if pose_timestamps and abs_poses are not the same length
+        ValueError: if pose_timestamps is not in ascending order
+
+    """
+    abs_poses = np.asarray(abs_poses, dtype=float)
+    return _slerp_poses(pose_timestamps, abs_poses[:, 0:3, 3],
+                        so3_to_quaternion(np.ascontiguousarray(abs_poses[:, 0:3, 0:3])), requested_timestamps)
+
+
+def _slerp_poses(pose_timestamps, abs_positions, abs_quaternions, requested_timestamps):
+    pose_timestamps = np.asarray(pose_timestamps, dtype=np.int64)
+    requested_timestamps = np.asarray(requested_timestamps, dtype=np.int64)
+
+    if len(pose_timestamps) != len(abs_positions):
+        raise ValueError('Must supply same number of timestamps as poses')
+    if np.any(np.diff(pose_timestamps) <= 0):
+        raise ValueError('Pose timestamps must be in ascending order')
+
+    # same bracketing as bisect.bisect in interpolate_poses
+    upper_indices = np.searchsorted(pose_timestamps, requested_timestamps, side='right')
+    lower_indices = np.maximum(upper_indices - 1, 0)
+    upper_indices = np.minimum(upper_indices, len(pose_timestamps) - 1)
+
+    intervals = pose_timestamps[upper_indices] - pose_timestamps[lower_indices]
+    fractions = np.zeros(len(requested_timestamps))
+    bracketed = intervals > 0
+    fractions[bracketed] = (requested_timestamps[bracketed] - pose_timestamps[lower_indices[bracketed]]) \
+        / intervals[bracketed]
+
+    quaternions_lower = abs_quaternions[lower_indices]
+    quaternions_upper = abs_quaternions[upper_indices]
+
+    d_array = (quaternions_lower * quaternions_upper).sum(1)
+
+    scale0_array = 1 - fractions
+    scale1_array = fractions.copy()
+
+    sin_interp = np.abs(d_array) < 1
+    theta_array = np.arccos(np.abs(d_array[sin_interp]))
+    scale0_array[sin_interp] = np.sin((1 - fractions[sin_interp]) * theta_array) / np.sin(theta_array)
+    scale1_array[sin_interp] = np.sin(fractions[sin_interp] * theta_array) / np.sin(theta_array)
+    scale1_array[d_array < 0] = -scale1_array[d_array < 0]
+
+    quaternions_interp = scale0_array[:, None] * quaternions_lower + scale1_array[:, None] * quaternions_upper
+    positions_interp = (1 - fractions)[:, None] * abs_positions[lower_indices] \
+        + fractions[:, None] * abs_positions[upper_indices]
+
+    poses = np.zeros((len(requested_timestamps), 4, 4))
+    poses[:, 0:3, 0:3] = quaternion_to_so3(quaternions_interp)
+    poses[:, 0:3, 3] = positions_interp
+    poses[:, 3, 3] = 1
+    return poses
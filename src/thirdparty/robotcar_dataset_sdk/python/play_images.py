@@ -24,6 +24,7 @@ parser = argparse.ArgumentParser(description='Play back images from a given dire
 
 parser.add_argument('dir', type=str, help='Directory containing images.')
 parser.add_argument('--models_dir', type=str, default=None, help='(optional) Directory containing camera model. If supplied, images will be undistorted before display')
+parser.add_argument('--cache_dir', type=str, default=None, help='(optional) Directory in which to cache the camera model as memory-mapped arrays')
 parser.add_argument('--scale', type=float, default=1.0, help='(optional) factor by which to scale images before display')
 
 args = parser.parse_args()
@@ -38,7 +39,7 @@ if not os.path.isfile(timestamps_path):
 
 model = None
 if args.models_dir:
-    model = CameraModel(args.models_dir, args.dir)
+    model = CameraModel(args.models_dir, args.dir, args.cache_dir)
 
 current_chunk = 0
 timestamps_file = open(timestamps_path)
@@ -22,18 +22,20 @@ from build_pointcloud import build_pointcloud
 from transform import build_se3_transform
 from image import load_image
 from camera_model import CameraModel
+from time_index import TimeIndex
 
 parser = argparse.ArgumentParser(description='Project LIDAR data into camera image')
 parser.add_argument('--image_dir', type=str, help='Directory containing images')
 parser.add_argument('--laser_dir', type=str, help='Directory containing LIDAR scans')
 parser.add_argument('--poses_file', type=str, help='File containing either INS or VO poses')
 parser.add_argument('--models_dir', type=str, help='Directory containing camera models')
+parser.add_argument('--cache_dir', type=str, default=None, help='(optional) Directory in which to cache the camera model')
 parser.add_argument('--extrinsics_dir', type=str, help='Directory containing sensor extrinsics')
 parser.add_argument('--image_idx', type=int, help='Index of image to display')
 
 args = parser.parse_args()
 
-model = CameraModel(args.models_dir, args.image_dir)
+model = CameraModel(args.models_dir, args.image_dir, args.cache_dir)
 
 extrinsics_path = os.path.join(args.extrinsics_dir, model.camera + '.txt')
 with open(extrinsics_path) as extrinsics_file:
@@ -56,11 +58,8 @@ timestamps_path = os.path.join(args.image_dir, os.pardir, model.camera + '.times
 if not os.path.isfile(timestamps_path):
     timestamps_path = os.path.join(args.image_dir, os.pardir, os.pardir, model.camera + '.timestamps')
 
-timestamp = 0
-with open(timestamps_path) as timestamps_file:
-    for i, line in enumerate(timestamps_file):
-        if i == args.image_idx:
-            timestamp = int(line.split(' ')[0])
+# QUT CHANGE: seek to the image through the time index instead of reading the timestamps file up to it
+timestamp = int(TimeIndex(timestamps_path).line(args.image_idx).split(' ')[0])
 
 pointcloud, reflectance = build_pointcloud(args.laser_dir, args.poses_file, args.extrinsics_dir,
                                            timestamp - 1e7, timestamp + 1e7, timestamp)
@@ -0,0 +1,170 @@
+################################################################################
+#
+# QUT CHANGE: added module. Sparse time index over timestamped text files, e.g.
+# <sensor>.timestamps files and the pose logs vo.csv, ins.csv and rtk.csv.
+#
+################################################################################
+
+import os
+import glob
+import numpy as np
+
+INDEX_DTYPE = np.dtype([('timestamp', np.int64), ('offset', np.int64), ('row', np.int64)])
+
+
+def atomic_save(path, array):
+    """Saves an array as a .npy file through a temporary file renamed over `path`.
+
+    Readers never see a partially written file. The temporary file is named after the process, so concurrent writers
+    of the same path do not clobber each other, and is removed if writing fails.
+
+    Args:
+        path (str): path of the .npy file.
+        array (numpy.ndarray): array to save.
+
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cached_array(path, tag, build):
+    """Returns an array derived from a file, cached as a .npy file next to the file.
+
+    The cache file is named after `tag` and the size and modification time of the file, so a file that changes gets
+    a new cache file, replacing the stale one. The cached array is memory-mapped. If the cache cannot be written,
+    e.g. on a read-only file system, the built array is returned.
+
+    Args:
+        path (str): path to the source file.
+        tag (str): name of the derived array, distinguishing caches of different arrays from the same file.
+        build (callable): path -> numpy.ndarray, builds the array from the source file.
+
+    Returns:
+        numpy.ndarray: the derived array.
+
+    """
+    stat = os.stat(path)
+    cache_prefix = os.path.join(os.path.dirname(path), '.{}.{}.'.format(os.path.basename(path), tag))
+    cache_path = '{}{}-{}.npy'.format(cache_prefix, stat.st_size, stat.st_mtime_ns)
+    try:
+        return np.load(cache_path, mmap_mode='r')
+    except (OSError, ValueError):
+        array = build(path)
+    try:
+        for stale_path in glob.glob(glob.escape(cache_prefix) + '*.npy'):
+            os.remove(stale_path)
+        atomic_save(cache_path, array)
+    except OSError:
+        pass
+    return array
+
+
+class TimeIndex(object):
+    """Seekable index over a text file with one record per line, sorted by the timestamp in its first column.
+
+    Every `stride`-th line is indexed by its timestamp, byte offset and row number, so a window of records is found
+    with a binary search over the index and read from the closest preceding indexed line, without reading the file
+    up to that point. The index is built in one pass over the file and cached next to it, see `cached_array`.
+
+    Attributes:
+        path (str): path to the indexed file.
+        stride (int): number of lines between indexed lines.
+        index (numpy.ndarray): indexed lines, see `INDEX_DTYPE`.
+
+    """
+
+    def __init__(self, path, stride=1024):
+        """Loads or builds the index of a file.
+
+        Args:
+            path (str): path to the file. Files ending in .csv are comma separated and start with a header line,
+                other files (e.g. .timestamps) are space separated.
+            stride (int): number of lines between indexed lines.
+
+        """
+        self.path = path
+        self.stride = stride
+        self._delimiter = b',' if path.endswith('.csv') else b' '
+        self._header = path.endswith('.csv')
+        self.index = cached_array(path, 'index{}'.format(stride), self.__build)
+
+    def __build(self, path):
+        index = []
+        with open(path, 'rb') as f:
+            offset = len(f.readline()) if self._header else 0
+            for row, line in enumerate(f):
+                if row % self.stride == 0:
+                    index.append((self._timestamp(line), offset, row))
+                offset += len(line)
+        return np.array(index, INDEX_DTYPE)
+
+    def _timestamp(self, line):
+        return int(line.split(self._delimiter, 1)[0])
+
+    def lines(self, start_time, end_time):
+        """Yields the lines with timestamps in a window.
+
+        Args:
+            start_time (int): UNIX timestamp of the start of the window (inclusive).
+            end_time (int): UNIX timestamp of the end of the window (inclusive).
+
+        Returns:
+            generator[str]: lines in the window, in file order.
+
+        """
+        if len(self.index) == 0:
+            return
+        # last indexed line before the window, every line before it is before the window too
+        entry = max(np.searchsorted(self.index['timestamp'], start_time, side='left') - 1, 0)
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.index['offset'][entry]))
+            for line in f:
+                timestamp = self._timestamp(line)
+                if timestamp > end_time:
+                    return
+                if timestamp >= start_time:
+                    yield line.decode()
+
+    def timestamps(self, start_time, end_time):
+        """Returns the timestamps in a window.
+
+        Args:
+            start_time (int): UNIX timestamp of the start of the window (inclusive).
+            end_time (int): UNIX timestamp of the end of the window (inclusive).
+
+        Returns:
+            numpy.ndarray: timestamps in the window.
+
+        """
+        return np.array([int(line.split(self._delimiter.decode(), 1)[0])
+                         for line in self.lines(start_time, end_time)], dtype=np.int64)
+
+    def line(self, row):
+        """Returns the line at a row number, counted from the first record.
+
+        Args:
+            row (int): row number.
+
+        Returns:
+            str: the line.
+
+        Raises:
+            IndexError: if the file has fewer rows.
+
+        """
+        entry = row // self.stride
+        if row < 0 or entry >= len(self.index):
+            raise IndexError('Row {} out of range'.format(row))
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.index['offset'][entry]))
+            for i, line in enumerate(f):
+                if i == row - int(self.index['row'][entry]):
+                    return line.decode()
+        raise IndexError('Row {} out of range'.format(row))
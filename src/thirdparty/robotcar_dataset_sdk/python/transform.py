@@ -22,6 +22,8 @@ MATRIX_MATCH_TOLERANCE = 1e-4
 def build_se3_transform(xyzrpy):
     """Creates an SE3 transform from translation and Euler angles.
 
+    QUT CHANGE: also accepts an (N, 6) array, returning an (N, 4, 4) array of transforms.
+
     Args:
         xyzrpy (list[float]): translation and Euler angles for transform. Must have six components.
 
@@ -32,6 +34,15 @@ def build_se3_transform(xyzrpy):
         ValueError: if `len(xyzrpy) != 6`
 
     """
+    if np.ndim(xyzrpy) == 2:
+        xyzrpy = np.asarray(xyzrpy, dtype=float)
+        if xyzrpy.shape[1] != 6:
+            raise ValueError("Must supply 6 values to build transform")
+        se3 = np.zeros((len(xyzrpy), 4, 4))
+        se3[:, 0:3, 0:3] = euler_to_so3(xyzrpy[:, 3:6])
+        se3[:, 0:3, 3] = xyzrpy[:, 0:3]
+        se3[:, 3, 3] = 1
+        return se3
     if len(xyzrpy) != 6:
         raise ValueError("Must supply 6 values to build transform")
 
@@ -44,6 +55,8 @@ def build_se3_transform(xyzrpy):
 def euler_to_so3(rpy):
     """Converts Euler angles to an SO3 rotation matrix.
 
+    QUT CHANGE: also accepts an (N, 3) array, returning an (N, 3, 3) array of rotation matrices.
+
     Args:
         rpy (list[float]): Euler angles (in radians). Must have three components.
 
@@ -54,6 +67,24 @@ def euler_to_so3(rpy):
         ValueError: if `len(rpy) != 3`.
 
     """
+    if np.ndim(rpy) == 2:
+        rpy = np.asarray(rpy, dtype=float)
+        if rpy.shape[1] != 3:
+            raise ValueError("Euler angles must have three components")
+        cr, cp, cy = np.cos(rpy).T
+        sr, sp, sy = np.sin(rpy).T
+        # R_z * R_y * R_x, expanded
+        so3 = np.empty((len(rpy), 3, 3))
+        so3[:, 0, 0] = cy * cp
+        so3[:, 0, 1] = cy * sp * sr - sy * cr
+        so3[:, 0, 2] = cy * sp * cr + sy * sr
+        so3[:, 1, 0] = sy * cp
+        so3[:, 1, 1] = sy * sp * sr + cy * cr
+        so3[:, 1, 2] = sy * sp * cr - cy * sr
+        so3[:, 2, 0] = -sp
+        so3[:, 2, 1] = cp * sr
+        so3[:, 2, 2] = cp * cr
+        return so3
     if len(rpy) != 3:
         raise ValueError("Euler angles must have three components")
 
@@ -73,6 +104,8 @@ def euler_to_so3(rpy):
 def so3_to_euler(so3):
     """Converts an SO3 rotation matrix to Euler angles
 
+    QUT CHANGE: also accepts an (N, 3, 3) array, returning an (N, 3) array of Euler angles.
+
     Args:
         so3: 3x3 rotation matrix
 
@@ -84,6 +117,8 @@ def so3_to_euler(so3):
         ValueError: if a valid Euler parametrisation cannot be found
 
     """
+    if so3.ndim == 3:
+        return _so3_to_euler_batch(np.asarray(so3))
     if so3.shape != (3, 3):
         raise ValueError("SO3 matrix must be 3x3")
     roll = atan2(so3[2, 1], so3[2, 2])
@@ -102,9 +137,29 @@ def so3_to_euler(so3):
         return np.matrix([roll, pitch_poss[1], yaw])
 
 
+def _so3_to_euler_batch(so3):
+    # same as so3_to_euler, checking both pitch solutions for all matrices at once
+    if so3.shape[1:] != (3, 3):
+        raise ValueError("SO3 matrix must be 3x3")
+    roll = np.arctan2(so3[:, 2, 1], so3[:, 2, 2])
+    yaw = np.arctan2(so3[:, 1, 0], so3[:, 0, 0])
+    denom = np.sqrt(so3[:, 0, 0] ** 2 + so3[:, 1, 0] ** 2)
+    pitch = np.arctan2(-so3[:, 2, 0], denom)
+
+    rpy = np.stack([roll, pitch, yaw], axis=1)
+    mismatch = (so3 - euler_to_so3(rpy)).sum(axis=(1, 2)) >= MATRIX_MATCH_TOLERANCE
+    if mismatch.any():
+        rpy[mismatch, 1] = np.arctan2(-so3[mismatch, 2, 0], -denom[mismatch])
+        if ((so3[mismatch] - euler_to_so3(rpy[mismatch])).sum(axis=(1, 2)) > MATRIX_MATCH_TOLERANCE).any():
+            raise ValueError("Could not find valid pitch angle")
+    return rpy
+
+
 def so3_to_quaternion(so3):
     """Converts an SO3 rotation matrix to a quaternion
 
+    QUT CHANGE: also accepts an (N, 3, 3) array, returning an (N, 4) array of quaternions.
+
     Args:
         so3: 3x3 rotation matrix
 
@@ -114,6 +169,8 @@ def so3_to_quaternion(so3):
     Raises:
         ValueError: if so3 is not 3x3
     """
+    if so3.ndim == 3:
+        return _so3_to_quaternion_batch(np.asarray(so3))
     if so3.shape != (3, 3):
         raise ValueError("SO3 matrix must be 3x3")
 
@@ -128,7 +185,8 @@ def so3_to_quaternion(so3):
     R_zz = so3[2, 2]
 
     try:
-        w = sqrt(so3.trace() + 1) / 2
+        # QUT CHANGE: sum the diagonal, the trace of a numpy.matrix is a 1x1 matrix that sqrt rejects in numpy 2
+        w = sqrt(R_xx + R_yy + R_zz + 1) / 2
     except(ValueError):
         # w is non-real
         w = 0
@@ -161,9 +219,41 @@ def so3_to_quaternion(so3):
     return np.array([w, x, y, z])
 
 
+def _so3_to_quaternion_batch(so3):
+    # same as so3_to_quaternion, solving for the other components from the largest one of each matrix
+    if so3.shape[1:] != (3, 3):
+        raise ValueError("SO3 matrix must be 3x3")
+    R_xx, R_xy, R_xz = so3[:, 0, 0], so3[:, 0, 1], so3[:, 0, 2]
+    R_yx, R_yy, R_yz = so3[:, 1, 0], so3[:, 1, 1], so3[:, 1, 2]
+    R_zx, R_zy, R_zz = so3[:, 2, 0], so3[:, 2, 1], so3[:, 2, 2]
+
+    quaternion = np.sqrt(np.maximum(np.stack([1 + R_xx + R_yy + R_zz,
+                                              1 + R_xx - R_yy - R_zz,
+                                              1 + R_yy - R_xx - R_zz,
+                                              1 + R_zz - R_yy - R_xx], axis=1), 0)) / 2
+    max_index = quaternion.argmax(axis=1)
+
+    # numerators of the components derived from each choice of largest component, in [w, x, y, z] order
+    numerators = [[None, R_zy - R_yz, R_xz - R_zx, R_yx - R_xy],
+                  [R_zy - R_yz, None, R_xy + R_yx, R_zx + R_xz],
+                  [R_xz - R_zx, R_xy + R_yx, None, R_yz + R_zy],
+                  [R_yx - R_xy, R_zx + R_xz, R_yz + R_zy, None]]
+    for i in range(4):
+        rows = max_index == i
+        if not rows.any():
+            continue
+        denom = 4 * quaternion[rows, i]
+        for j in range(4):
+            if j != i:
+                quaternion[rows, j] = numerators[i][j][rows] / denom
+    return quaternion
+
+
 def se3_to_components(se3):
     """Converts an SE3 rotation matrix to linear translation and Euler angles
 
+    QUT CHANGE: also accepts an (N, 4, 4) array, returning an (N, 6) array of components.
+
     Args:
         se3: 4x4 transformation matrix
 
@@ -175,9 +265,108 @@ def se3_to_components(se3):
         ValueError: if a valid Euler parametrisation cannot be found
 
     """
+    if se3.ndim == 3:
+        if se3.shape[1:] != (4, 4):
+            raise ValueError("SE3 transform must be a 4x4 matrix")
+        xyzrpy = np.empty((len(se3), 6))
+        xyzrpy[:, 0:3] = se3[:, 0:3, 3]
+        xyzrpy[:, 3:6] = _so3_to_euler_batch(np.asarray(se3[:, 0:3, 0:3]))
+        return xyzrpy
     if se3.shape != (4, 4):
         raise ValueError("SE3 transform must be a 4x4 matrix")
     xyzrpy = np.empty(6)
     xyzrpy[0:3] = se3[0:3, 3].transpose()
     xyzrpy[3:6] = so3_to_euler(se3[0:3, 0:3])
     return xyzrpy
+
+
+def euler_to_quaternion(rpy):
+    """Converts Euler angles to quaternions, for a single rotation or a stack of rotations.
+
+    QUT CHANGE: added function. Gives the rotation of `euler_to_so3` without building the matrices.
+
+    Args:
+        rpy (numpy.ndarray): Euler angles (in radians), shape (3,) or (N, 3).
+
+    Returns:
+        numpy.ndarray: quaternions [w, x, y, z], shape (4,) or (N, 4)
+
+    Raises:
+        ValueError: if the last dimension of `rpy` is not 3.
+
+    """
+    rpy = np.asarray(rpy, dtype=float)
+    if rpy.shape[-1] != 3:
+        raise ValueError("Euler angles must have three components")
+    cr, cp, cy = np.cos(rpy / 2).T
+    sr, sp, sy = np.sin(rpy / 2).T
+    return np.stack([cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy], axis=-1)
+
+
+def quaternion_to_so3(quaternion):
+    """Converts quaternions to SO3 rotation matrices, for a single rotation or a stack of rotations.
+
+    QUT CHANGE: added function.
+
+    Args:
+        quaternion (numpy.ndarray): unit quaternions [w, x, y, z], shape (4,) or (N, 4).
+
+    Returns:
+        numpy.ndarray: rotation matrices, shape (3, 3) or (N, 3, 3)
+
+    Raises:
+        ValueError: if the last dimension of `quaternion` is not 4.
+
+    """
+    quaternion = np.asarray(quaternion, dtype=float)
+    if quaternion.shape[-1] != 4:
+        raise ValueError("Quaternions must have four components")
+    w, x, y, z = np.moveaxis(quaternion, -1, 0)
+    so3 = np.empty(quaternion.shape[:-1] + (3, 3))
+    so3[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    so3[..., 0, 1] = 2 * (x * y - z * w)
+    so3[..., 0, 2] = 2 * (x * z + y * w)
+    so3[..., 1, 0] = 2 * (x * y + z * w)
+    so3[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    so3[..., 1, 2] = 2 * (y * z - x * w)
+    so3[..., 2, 0] = 2 * (x * z - y * w)
+    so3[..., 2, 1] = 2 * (y * z + x * w)
+    so3[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return so3
+
+
+def cumulative_se3(se3, block_size=None):
+    """Accumulates a sequence of relative SE3 transforms into absolute transforms.
+
+    QUT CHANGE: added function. Computes the prefix products se3[0], se3[0] * se3[1], ... as a blocked scan: the
+    products within each block of `block_size` transforms are accumulated for all blocks at once, then each block is
+    composed with the last product of the block before it. This takes about 2 * sqrt(N) batched matrix products
+    instead of N single ones, and matches sequential composition up to floating point rounding.
+
+    Args:
+        se3 (numpy.ndarray): relative transforms, shape (N, 4, 4).
+        block_size (int): (optional) number of transforms per block, about sqrt(N) by default.
+
+    Returns:
+        numpy.ndarray: absolute transforms, shape (N, 4, 4)
+
+    """
+    se3 = np.asarray(se3, dtype=float)
+    n = len(se3)
+    if n == 0:
+        return se3.copy()
+    if block_size is None:
+        block_size = max(int(sqrt(n)), 1)
+    n_blocks = -(-n // block_size)
+    # pad the last block with identities
+    blocks = np.tile(np.identity(4), (n_blocks * block_size, 1, 1))
+    blocks[:n] = se3
+    blocks = blocks.reshape(n_blocks, block_size, 4, 4)
+    for i in range(1, block_size):
+        blocks[:, i] = blocks[:, i - 1] @ blocks[:, i]
+    for b in range(1, n_blocks):
+        blocks[b] = blocks[b - 1, -1] @ blocks[b]
+    return blocks.reshape(-1, 4, 4)[:n]
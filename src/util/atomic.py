@@ -0,0 +1,24 @@
+import os
+import contextlib
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb"):
+    """
+    Opens a temporary file next to path for writing and renames it over path
+    once the block completes, so readers never see a partially written file.
+    The temporary file is named after the process, so concurrent writers of
+    the same path do not clobber each other, and is removed if writing fails.
+    e.g.
+        with atomic_write(path) as f:
+            np.save(f, array)
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,47 @@
+import time
+import argparse
+
+import numpy as np
+
+from src.thirdparty.robotcar_dataset_sdk.python.transform import build_se3_transform, euler_to_so3, so3_to_euler, \
+    so3_to_quaternion, se3_to_components
+
+
+def random_xyzrpy(n, seed=0):
+    rng = np.random.default_rng(seed)
+    xyzrpy = np.empty((n, 6))
+    xyzrpy[:, :3] = rng.uniform(-1000, 1000, (n, 3))
+    xyzrpy[:, 3:] = rng.uniform(-np.pi, np.pi, (n, 3))
+    # keep pitch away from +-pi/2, where roll and yaw are not unique and round trips are not expected to match
+    xyzrpy[:, 4] /= 2.2
+    return xyzrpy
+
+
+def compare(name, scalar_fn, batch_fn, inputs, batch_input):
+    start = time.time()
+    expected = np.array([np.asarray(scalar_fn(x)).squeeze() for x in inputs])
+    scalar_time = time.time() - start
+    start = time.time()
+    result = batch_fn(batch_input)
+    batch_time = time.time() - start
+    # quaternions q and -q are the same rotation
+    error = np.abs(result - expected).max() if name != "so3_to_quaternion" else \
+        np.minimum(np.abs(result - expected), np.abs(result + expected)).max()
+    print("{:<20} scalar {:8.3f}s  batch {:8.4f}s  speedup {:7.1f}x  max abs difference {:.2e}".format(
+        name, scalar_time, batch_time, scalar_time / batch_time, error))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compares the batched transform.py kernels against the scalar functions on random poses")
+    parser.add_argument("-n", "--num-poses", type=int, default=20000, help="Number of random poses")
+    args = parser.parse_args()
+
+    xyzrpy = random_xyzrpy(args.num_poses)
+    se3 = build_se3_transform(xyzrpy)
+    so3 = np.ascontiguousarray(se3[:, :3, :3])
+    compare("build_se3_transform", build_se3_transform, build_se3_transform, xyzrpy, xyzrpy)
+    compare("euler_to_so3", euler_to_so3, euler_to_so3, xyzrpy[:, 3:], xyzrpy[:, 3:])
+    compare("so3_to_euler", lambda R: so3_to_euler(np.asmatrix(R)), so3_to_euler, so3, so3)
+    compare("so3_to_quaternion", so3_to_quaternion, so3_to_quaternion, so3, so3)
+    compare("se3_to_components", se3_to_components, se3_to_components, se3, se3)
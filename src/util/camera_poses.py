@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation
+
+from src.thirdparty.robotcar_dataset_sdk.python.transform import se3_to_components, so3_to_euler, \
+    so3_to_quaternion, quaternion_to_so3
+from src.util.geometry import SE3
+from src.util.atomic import atomic_write
+
+# columnar binary camera poses, one record per image: timestamp, position and unit quaternion [w, x, y, z]
+POSES_DTYPE = np.dtype([("timestamp", np.int64), ("xyz", np.float64, (3,)), ("quaternion", np.float64, (4,))])
+CSV_NAME = "camera_poses.csv"
+BINARY_NAME = "camera_poses.npy"
+COLUMNS = ["northing", "easting", "down", "roll", "pitch", "yaw"]
+
+
+def save_camera_poses(save_dir, tstamps, poses):
+    """
+    Writes the (N, 4, 4) camera poses at the image timestamps to
+    camera_poses.csv and, at full precision, to camera_poses.npy.
+    """
+    records = np.empty(len(tstamps), POSES_DTYPE)
+    records["timestamp"] = tstamps
+    records["xyz"] = poses[:, :3, 3]
+    records["quaternion"] = so3_to_quaternion(np.ascontiguousarray(poses[:, :3, :3]))
+    with atomic_write(os.path.join(save_dir, BINARY_NAME)) as f:
+        np.save(f, records)
+    df = pd.DataFrame(se3_to_components(poses), columns=COLUMNS)
+    df.insert(0, "timestamp", tstamps, True)
+    df.to_csv(os.path.join(save_dir, CSV_NAME))
+
+
+def read_camera_poses(folder):
+    """
+    Returns the memory-mapped records of camera_poses.npy in a folder, see
+    POSES_DTYPE, or None if the folder has no binary camera poses.
+    """
+    path = os.path.join(folder, BINARY_NAME)
+    return np.load(path, mmap_mode="r") if os.path.isfile(path) else None
+
+
+def load_camera_poses(folder):
+    """
+    Returns the camera poses of a folder as a DataFrame with the columns of
+    camera_poses.csv, read from camera_poses.npy if present and from the
+    CSV otherwise.
+    """
+    records = read_camera_poses(folder)
+    if records is None:
+        return pd.read_csv(os.path.join(folder, CSV_NAME))
+    rpy = so3_to_euler(quaternion_to_so3(records["quaternion"]))
+    df = pd.DataFrame(np.hstack((records["xyz"], rpy)), columns=COLUMNS)
+    df.insert(0, "timestamp", np.asarray(records["timestamp"]), True)
+    # the unnamed index column pd.read_csv gives for camera_poses.csv
+    df.insert(0, "Unnamed: 0", np.arange(len(df)), True)
+    return df
+
+
+def load_poses(folder):
+    """
+    Returns the image timestamps and camera poses (SE3) of a folder, read
+    from camera_poses.npy if present and from the CSV otherwise.
+    """
+    records = read_camera_poses(folder)
+    if records is None:
+        df = pd.read_csv(os.path.join(folder, CSV_NAME))
+        xyzrpy = df[COLUMNS].to_numpy()
+        # rotation Rz(yaw) Ry(pitch) Rx(roll), as euler_to_so3 and the quaternions of camera_poses.npy
+        quaternion = Rotation.from_euler("ZYX", xyzrpy[:, [5, 4, 3]]).as_quat()
+        return df["timestamp"].to_numpy(), SE3.from_data(np.hstack((xyzrpy[:, :3], quaternion)))
+    # quaternions are stored [w, x, y, z], SE3 holds [x, y, z, w]
+    return np.asarray(records["timestamp"]), \
+        SE3.from_data(np.hstack((records["xyz"], records["quaternion"][:, [1, 2, 3, 0]])))
@@ -1,99 +1,214 @@
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 from scipy.spatial.transform import Rotation
 
 
+def _quat_multiply(q1, q2):
+    # Hamilton product of scalar last quaternions [x, y, z, w], broadcast over leading dimensions
+    v1, w1 = q1[..., :3], q1[..., 3:]
+    v2, w2 = q2[..., :3], q2[..., 3:]
+    return np.concatenate((w1 * v2 + w2 * v1 + np.cross(v1, v2),
+                           w1 * w2 - np.sum(v1 * v2, axis=-1, keepdims=True)), axis=-1)
+
+
+def _quat_rotate(q, v):
+    # rotates vectors v by unit quaternions q, broadcast over leading dimensions
+    u, w = q[..., :3], q[..., 3:]
+    uv = np.cross(u, v)
+    return v + 2 * (w * uv + np.cross(u, uv))
+
+
+def _quat_conjugate(q):
+    return np.concatenate((-q[..., :3], q[..., 3:]), axis=-1)
+
+
+def _quat_angle(q):
+    # rotation angle in [0, pi] of unit quaternions, as Rotation.magnitude
+    return 2 * np.arctan2(np.linalg.norm(q[..., :3], axis=-1), np.abs(q[..., 3]))
+
+
+def _quat_distance(q1, q2):
+    # angle of the relative rotation between unit quaternions, without forming it. q1 and q2 are 4-vectors at
+    # angle phi with |q1 - q2| = 2 sin(phi / 2) and |q1 + q2| = 2 cos(phi / 2), and the rotation angle is 2 phi
+    # after flipping q2 into the same hemisphere as q1
+    q2 = q2 * np.where(np.sum(q1 * q2, axis=-1, keepdims=True) < 0, -1., 1.)
+    return 4 * np.arctan2(np.linalg.norm(q1 - q2, axis=-1), np.linalg.norm(q1 + q2, axis=-1))
+
+
 class SE3:
-    def __init__(self, t, R):
-        self._single = False
+    """
+    Set of N poses stored as one contiguous (N x 7) array of translation and
+    scalar last unit quaternion [x, y, z, qx, qy, qz, qw]. Indexing with an
+    integer or slice returns a view on the same array, and compose, inv and
+    relative can write into an existing SE3 with `out` to avoid allocating
+    new poses in loops.
+    """
+    __slots__ = ("_data", "_single")
 
+    def __init__(self, t, R):
         if t.ndim not in [1, 2] or t.shape[-1] != 3:
             raise ValueError("Expected `t` to have shape (3,) or (N x 3), "
                              "got {}.".format(t.shape))
+        quat = np.atleast_2d(R.as_quat())
 
         # If a single translation is given, convert it to a 2D 1 x 3 matrix but
         # set self._single to True so that we can return appropriate objects
         # in the `to_...` methods
+        single = False
         if t.shape == (3,):
             t = t[None, :]
-            self._single = True
-            if len(R) > 1:            
-                raise ValueError("Different number of translations 1 and rotations {}.".format(len(R)))
+            single = True
+            if len(quat) > 1:
+                raise ValueError("Different number of translations 1 and rotations {}.".format(len(quat)))
         elif len(t) == 1:
-            self._single = True
+            single = True
         else:
-            if len(t) != len(R):
-                raise ValueError("Differing number of translations {} and rotations {}".format(len(t),len(R)))
-        self._t = t
-        self._R = R
-        self.len = len(R)
+            if len(t) != len(quat):
+                raise ValueError("Differing number of translations {} and rotations {}".format(len(t), len(quat)))
+        self._data = np.empty((len(t), 7))
+        self._data[:, :3] = t
+        self._data[:, 3:] = quat
+        self._single = single
+
+    def __getstate__(self):
+        return {"_data": self._data, "_single": self._single}
+
+    def __setstate__(self, state):
+        # pickles of the previous SE3, which held a translation array `_t` and a Rotation `_R`, are converted on load
+        if "_data" in state:
+            self._data = state["_data"]
+        else:
+            t = np.atleast_2d(state["_t"])
+            self._data = np.empty((len(t), 7))
+            self._data[:, :3] = t
+            self._data[:, 3:] = np.atleast_2d(state["_R"].as_quat())
+        self._single = state["_single"]
+
+    @classmethod
+    def from_data(cls, data, single=None):
+        """
+        Wraps an (N x 7) array of [x, y, z, qx, qy, qz, qw] without copying it.
+        """
+        if data.ndim != 2 or data.shape[1] != 7:
+            raise ValueError("Expected `data` to have shape (N x 7), got {}.".format(data.shape))
+        pose = cls.__new__(cls)
+        pose._data = data
+        pose._single = len(data) == 1 if single is None else single
+        return pose
+
+    @classmethod
+    def empty(cls, n):
+        return cls.from_data(np.empty((n, 7)))
 
     @classmethod
     def from_xyzrpy(cls, xyzrpy):
-        t = xyzrpy[:, :3] 
-        R = Rotation.from_euler('ZYX', xyzrpy[:, 3:])
-        return cls(t, R)
+        data = np.empty((len(xyzrpy), 7))
+        data[:, :3] = xyzrpy[:, :3]
+        data[:, 3:] = Rotation.from_euler('ZYX', xyzrpy[:, 3:]).as_quat()
+        return cls.from_data(data)
 
     @classmethod
     def from_xyzquat(cls, t, quat):
-        R = Rotation.from_quat(quat) 
+        R = Rotation.from_quat(quat)
         return cls(t, R)
 
     @classmethod
     def from_mat(cls, T):
-        R = Rotation.from_quat(T[:, :3, :3])    
+        R = Rotation.from_matrix(T[:, :3, :3])
         t = T[:, :3, 3]
         return cls(t, R)
 
     def __getitem__(self, indexer):
-        return self.__class__(self.t()[indexer], self.R()[indexer])
+        if isinstance(indexer, (int, np.integer)):
+            # basic indexing, a view of one row
+            return self.from_data(self._data[indexer][None, :], single=True)
+        return self.from_data(self._data[indexer])
 
     def __len__(self):
-        return self.len
+        return len(self._data)
 
-    def __mul__(self, other):
-        """
-        Performs element-wise pose composition.
-        """
+    @property
+    def len(self):
+        return len(self._data)
+
+    @property
+    def data(self):
+        return self._data
+
+    def _check_lengths(self, other):
         if not(len(self) == 1 or len(other) == 1 or len(self) == len(other)):
             raise ValueError("Expected equal number of transformations in both "
                              "or a single transformation in either object, "
                              "got {} transformations in first and {} transformations in "
                              "second object.".format(
                                 len(self), len(other)))
-        return self.__class__(self.R().apply(other.t()) + self.t(), self.R() * other.R())
+
+    def _output(self, t, q, out):
+        if out is None:
+            out = self.empty(len(t))
+        out._data[:, :3] = t
+        out._data[:, 3:] = q
+        return out
+
+    def compose(self, other, out=None):
+        """
+        Performs element-wise pose composition, written into `out` if given.
+        """
+        self._check_lengths(other)
+        q1 = self._data[:, 3:]
+        t = _quat_rotate(q1, other._data[:, :3]) + self._data[:, :3]
+        q = _quat_multiply(q1, other._data[:, 3:])
+        return self._output(t, q, out)
+
+    def relative(self, other, out=None):
+        """
+        Computes relative pose self.inv() * other, written into `out` if given.
+        """
+        self._check_lengths(other)
+        q1_inv = _quat_conjugate(self._data[:, 3:])
+        t = _quat_rotate(q1_inv, other._data[:, :3] - self._data[:, :3])
+        q = _quat_multiply(q1_inv, other._data[:, 3:])
+        return self._output(t, q, out)
+
+    def __mul__(self, other):
+        """
+        Performs element-wise pose composition.
+        """
+        return self.compose(other)
 
     def __truediv__(self, other):
         """
         Computes relative pose, similar to MATLAB convention (x = A \ b for Ax = b). Example:
         T1 / T2 = T1.inv() * T2
-        TO DO: Broadcasting
         """
-        if not(len(self) == 1 or len(other) == 1 or len(self) == len(other)):
-            raise ValueError("Expected equal number of transformations in both "
-                             "or a single transformation in either object, "
-                             "got {} transformations in first and {} transformations in "
-                             "second object.".format(
-                                len(self), len(other)))
-        R1_inv = self.R().inv()
-        t_new = R1_inv.apply(other.t() - self.t())
-        return self.__class__(t_new, R1_inv * other.R())
+        return self.relative(other)
 
     def t(self):
-        return self._t[0] if self._single else self._t
+        return self._data[0, :3] if self._single else self._data[:, :3]
+
+    def quat(self):
+        return self._data[:, 3:]
 
     def R(self):
-        return self._R
+        return Rotation.from_quat(self._data[:, 3:])
 
-    def inv(self):
-        R_inv = self.R().inv()
-        t_new = -R_inv.apply(self.t())
-        return SE3(t_new, R_inv)
+    def inv(self, out=None):
+        """
+        Inverts each pose, written into `out` if given.
+        """
+        q_inv = _quat_conjugate(self._data[:, 3:])
+        t = -_quat_rotate(q_inv, self._data[:, :3])
+        out = self._output(t, q_inv, out)
+        out._single = self._single
+        return out
 
     def components(self):
         return self.t(), self.R()
 
     def magnitude(self):
-        return np.linalg.norm(self.t(), axis=-1), self.R().magnitude()
+        angle = _quat_angle(self._data[:, 3:])
+        return np.linalg.norm(self.t(), axis=-1), angle[0] if self._single else angle
 
 
 def metric(p1, p2, w):
@@ -112,10 +227,81 @@ def metric(p1, p2, w):
                             len(p1), len(p2)))
     if w < 0:
         raise ValueError("Weight must be non-negative, currently {}".format(w))
-    p_rel = p1 / p2
-    t_dist = np.linalg.norm(p_rel.t(), axis=-1)
-    R_dist = p_rel.R().magnitude()
-    return t_dist + w * R_dist 
+    # rotations preserve length, so the translation of p1 / p2 has the norm of the difference in translations
+    t_dist = np.linalg.norm(p1.t() - p2.t(), axis=-1)
+    R_dist = _quat_distance(p1.quat(), p2.quat())
+    dist = t_dist + w * R_dist
+    return dist[0] if p1._single and p2._single else dist
+
+
+def _pairwise_metric(t1, q1, t2, q2, w):
+    # (len(t1) x len(t2)) metric between all pairs of poses. Translation differences are formed per axis rather than
+    # by expanding |t1 - t2|^2 into dot products, which loses precision at map coordinates of millions of metres.
+    # For unit quaternions at dot product d, |q1 -+ q2| = sqrt(2 -+ 2 |d|) after flipping q2 into the hemisphere of
+    # q1, so the rotation angle of _quat_distance follows from the dot products alone
+    dist = np.zeros((len(t1), len(t2)))
+    for i in range(3):
+        diff = np.subtract.outer(t1[:, i], t2[:, i])
+        dist += np.multiply(diff, diff, out=diff)
+    np.sqrt(dist, out=dist)
+    if w != 0:
+        dots = np.minimum(np.abs(q1 @ q2.T), 1.)
+        dist += w * 4 * np.arctan2(np.sqrt(1 - dots), np.sqrt(1 + dots))
+    return dist
+
+
+def pairwise_metric(p1, p2, w):
+    """
+    Computes metric between all pairs of poses.
+    Args:
+        p1 (SE3) : set of N1 poses
+        p2 (SE3) : set of N2 poses
+        w (float > 0) : weight for attitude component
+    Returns:
+        (N1 x N2) array of distances
+    """
+    if w < 0:
+        raise ValueError("Weight must be non-negative, currently {}".format(w))
+    return _pairwise_metric(p1.data[:, :3], p1.data[:, 3:], p2.data[:, :3], p2.data[:, 3:], w)
+
+
+def nearest_poses(p1, p2, w, k=1, block_size=256, nWorkers=None):
+    """
+    Finds the k nearest poses in p2 to each pose in p1 under metric. Distances
+    are computed for block_size poses of p1 against all of p2 at a time, so
+    memory is bounded by block_size x N2 distances per worker, and blocks are
+    processed by a pool of nWorkers threads (numpy releases the GIL in the
+    kernels).
+    Args:
+        p1 (SE3) : set of N1 poses
+        p2 (SE3) : set of N2 poses
+        w (float > 0) : weight for attitude component
+        k (int) : number of nearest poses, at most N2
+    Returns:
+        (N1 x k) indices into p2 and (N1 x k) distances, nearest first
+    """
+    if w < 0:
+        raise ValueError("Weight must be non-negative, currently {}".format(w))
+    k = min(k, len(p2))
+    indices = np.empty((len(p1), k), dtype=np.int64)
+    distances = np.empty((len(p1), k))
+    t2, q2 = p2.data[:, :3], p2.data[:, 3:]
+
+    def process_block(start):
+        stop = min(start + block_size, len(p1))
+        dist = _pairwise_metric(p1.data[start:stop, :3], p1.data[start:stop, 3:], t2, q2, w)
+        if k == 1:
+            ind = np.argmin(dist, axis=1)[:, None]
+        else:
+            ind = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(dist, ind, axis=1), axis=1, kind="stable")
+            ind = np.take_along_axis(ind, order, axis=1)
+        indices[start:stop] = ind
+        distances[start:stop] = np.take_along_axis(dist, ind, axis=1)
+
+    with ThreadPool(nWorkers) as pool:
+        pool.map(process_block, range(0, len(p1), block_size))
+    return indices, distances
 
 
 def error(p1, p2):
@@ -130,9 +316,36 @@ def error(p1, p2):
 
 
 def combine(listOfPoses):
-    tList = []
-    qList = []
-    for pose in listOfPoses:
-        tList.append(pose.t())
-        qList.append(pose.R().as_quat())
-    return SE3(np.asarray(tList), Rotation.from_quat(np.asarray(qList)))
+    return SE3.from_data(np.concatenate([pose.data for pose in listOfPoses]))
+
+
+def keyframe_indices(poses, w, thres, block_size=64):
+    """
+    Subsamples poses at regular spatial intervals, returning the indices of
+    the first pose and of each pose whose metric distance (weight w) from the
+    previous keyframe exceeds thres. Gives the same indices as comparing poses
+    one at a time, but distances from the current keyframe are computed for a
+    block of poses at once and the scan jumps straight to the first pose over
+    the threshold. Each block is sized from the gap to the previous keyframe
+    (at most block_size) and doubles while no pose in it is over the
+    threshold, e.g. while the vehicle is stationary.
+    """
+    if len(poses) == 0:
+        return np.empty(0, dtype=np.int64)
+    indices = [0]
+    curr = 0
+    start = 1
+    size = block_size
+    while start < len(poses):
+        stop = min(start + size, len(poses))
+        over = np.flatnonzero(metric(poses[curr], poses[start:stop], w) > thres)
+        if len(over):
+            gap = start + int(over[0]) - curr
+            curr += gap
+            indices.append(curr)
+            start = curr + 1
+            size = min(2 * gap, block_size)
+        else:
+            start = stop
+            size *= 2
+    return np.asarray(indices, dtype=np.int64)
@@ -0,0 +1,188 @@
+import os
+import json
+import fcntl
+import argparse
+import contextlib
+
+import numpy as np
+
+from src.settings import READY_DIR, PROCESSED_DIR, camera_names
+from src.util.geometry import SE3
+from src.util.atomic import atomic_write
+from src.util.camera_poses import load_poses
+from src.util.pose_index import PoseIndex
+
+# one record per image of a traverse/camera segment, pose as [x, y, z, qx, qy, qz, qw] (see geometry.SE3)
+RECORD_DTYPE = np.dtype([("timestamp", np.int64), ("pose", np.float64, (7,))])
+# query matches, segment being the id of the traverse/camera pair in the database
+MATCH_DTYPE = np.dtype([("query", np.int64), ("segment", np.int32), ("timestamp", np.int64),
+                        ("pose", np.float64, (7,)), ("t_dist", np.float64), ("R_dist", np.float64)])
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+DB_DIR = os.path.join(PROCESSED_DIR, "pose_db")
+
+
+class PoseDatabase:
+    """
+    On-disk database of the camera poses of many traverses and cameras. Each
+    traverse/camera pair is a segment stored in its own .npy file of records
+    (see RECORD_DTYPE) and listed in manifest.json with its bounding box, so
+    a traverse is added or replaced without touching the other segments.
+    Segments are memory-mapped and their spatial index (see PoseIndex) built
+    on first query. Processes adding to the same database take turns under
+    a lock on manifest.lock.
+    """
+
+    def __init__(self, path=DB_DIR):
+        self.path = path
+        self.segments = self._read_manifest()
+        self._records = {}
+        self._indices = {}
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            return []
+        with open(manifest_path) as f:
+            return json.load(f)["segments"]
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # exclusive lock held while the manifest is re-read, updated and written, so concurrent adds are not lost
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_NAME), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        # picks up segments added or replaced by other processes, dropping the cached maps of replaced segments
+        segments = self._read_manifest()
+        for i, segment in enumerate(self.segments):
+            if i >= len(segments) or segments[i] != segment:
+                self._records.pop(i, None)
+                self._indices.pop(i, None)
+        self.segments = segments
+
+    def __len__(self):
+        return sum(segment["count"] for segment in self.segments)
+
+    def __contains__(self, key):
+        return self.segment_id(*key) is not None
+
+    def segment_id(self, traverse, camera):
+        for i, segment in enumerate(self.segments):
+            if segment["traverse"] == traverse and segment["camera"] == camera:
+                return i
+        return None
+
+    def records(self, segment_id):
+        """
+        Returns the memory-mapped records of a segment.
+        """
+        if segment_id not in self._records:
+            self._records[segment_id] = np.load(os.path.join(self.path, self.segments[segment_id]["file"]),
+                                                mmap_mode="r")
+        return self._records[segment_id]
+
+    def poses(self, segment_id):
+        return SE3.from_data(self.records(segment_id)["pose"], single=False)
+
+    def add(self, traverse, camera, tstamps, poses, overwrite=False):
+        """
+        Adds the poses (SE3) at the image timestamps of a traverse/camera pair
+        and returns its segment id. An existing pair is replaced, keeping its
+        id, if overwrite is set.
+        """
+        with self._locked():
+            self._refresh()
+            segment_id = self.segment_id(traverse, camera)
+            if segment_id is not None and not overwrite:
+                raise ValueError("{} {} is already in the pose database".format(traverse, camera))
+            records = np.empty(len(tstamps), RECORD_DTYPE)
+            records["timestamp"] = tstamps
+            records["pose"] = poses.data
+            fname = "{}_{}.npy".format(traverse, camera.replace("/", "_"))
+            segment = {"traverse": traverse, "camera": camera, "file": fname, "count": len(records),
+                       "min": poses.data[:, :3].min(axis=0).tolist() if len(records) else [np.inf] * 3,
+                       "max": poses.data[:, :3].max(axis=0).tolist() if len(records) else [-np.inf] * 3}
+            with atomic_write(os.path.join(self.path, fname)) as f:
+                np.save(f, records)
+            if segment_id is None:
+                segment_id = len(self.segments)
+                self.segments.append(segment)
+            else:
+                self.segments[segment_id] = segment
+                self._records.pop(segment_id, None)
+                self._indices.pop(segment_id, None)
+            with atomic_write(os.path.join(self.path, MANIFEST_NAME), "w") as f:
+                json.dump({"segments": self.segments}, f, indent=1)
+        return segment_id
+
+    def add_traverse(self, traverse, camera, overwrite=False, ready_dir=READY_DIR):
+        """
+        Adds the camera poses of a traverse from its ready camera folder.
+        """
+        tstamps, poses = load_poses(os.path.join(ready_dir, traverse, camera))
+        return self.add(traverse, camera, tstamps, poses, overwrite)
+
+    def _index(self, segment_id):
+        if segment_id not in self._indices:
+            self._indices[segment_id] = PoseIndex(self.poses(segment_id), 0)
+        return self._indices[segment_id]
+
+    def within(self, queries, t_tol, R_tol, cameras=None):
+        """
+        Finds the images of all traverses within t_tol (m) and R_tol (rad) of
+        each query pose, e.g. within(pose, 5, np.radians(15)). Segments whose
+        bounding box is further than t_tol from all queries are skipped.
+        Args:
+            queries (SE3) : set of N query poses
+            cameras (list) : cameras to search, all if None
+        Returns:
+            matches (see MATCH_DTYPE) ordered by query, segment and timestamp
+        """
+        t = queries.data[:, :3]
+        matches = []
+        for segment_id, segment in enumerate(self.segments):
+            if cameras is not None and segment["camera"] not in cameras:
+                continue
+            if not np.any(np.all((t >= np.array(segment["min"]) - t_tol) &
+                                 (t <= np.array(segment["max"]) + t_tol), axis=1)):
+                continue
+            offsets, indices, distances = self._index(segment_id).within(queries, t_tol, R_tol)
+            found = np.empty(len(indices), MATCH_DTYPE)
+            found["query"] = np.repeat(np.arange(len(queries)), np.diff(offsets))
+            found["segment"] = segment_id
+            found["timestamp"] = self.records(segment_id)["timestamp"][indices]
+            found["pose"] = self.records(segment_id)["pose"][indices]
+            found["t_dist"] = distances[:, 0]
+            found["R_dist"] = distances[:, 1]
+            matches.append(found)
+        matches = np.concatenate(matches) if matches else np.empty(0, MATCH_DTYPE)
+        # segments were visited in order, so a stable sort by query keeps the segment and timestamp order
+        return matches[np.argsort(matches["query"], kind="stable")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the camera poses of traverses to the pose database")
+    parser.add_argument("-t", "--traverses", nargs="+", type=str, required=True,
+                        help="<Required> names of traverses to add")
+    parser.add_argument("-c", "--cameras", nargs="+", type=str, required=True,
+                        help="<Required> cameras to add e.g. mono_(left|right|rear) stereo/(left|centre|right) or all")
+    parser.add_argument("-p", "--path", type=str, default=DB_DIR, help="pose database folder")
+    parser.add_argument("-o", "--overwrite", action="store_true",
+                        help="Replace traverses already in the database")
+    args = parser.parse_args()
+
+    cameras = camera_names if "all" in args.cameras else args.cameras
+    db = PoseDatabase(args.path)
+    for traverse in args.traverses:
+        for camera in cameras:
+            if (traverse, camera) in db and not args.overwrite:
+                print("{} {} already in pose database, skipping".format(traverse, camera))
+                continue
+            db.add_traverse(traverse, camera, overwrite=args.overwrite)
+            print("{} {} added to pose database".format(traverse, camera))
@@ -0,0 +1,109 @@
+import itertools
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from src.util import geometry
+
+
+class PoseIndex:
+    """
+    Spatial index over a set of poses for nearest neighbour and radius
+    queries under geometry.metric with attitude weight w. Positions are held
+    in a KD-tree. The metric is at least the translation distance, so every
+    pose within metric distance r of a query lies in the ball of radius r
+    around it. Candidates from the ball are re-scored with the full metric,
+    so results are exact while only nearby poses are compared.
+    """
+
+    def __init__(self, poses, w, leafsize=16):
+        if w < 0:
+            raise ValueError("Weight must be non-negative, currently {}".format(w))
+        self.poses = poses
+        self.w = w
+        self.tree = cKDTree(poses.data[:, :3], leafsize=leafsize)
+
+    def __len__(self):
+        return len(self.poses)
+
+    def _ball(self, queries, radius):
+        # candidate (query row, pose index) pairs within translation radius, as flat arrays ordered by row and index.
+        # The radius is padded so that rounding in the tree distances never drops a pose right on the boundary
+        radius = np.broadcast_to(radius, (len(queries),)) * (1 + 1e-9) + 1e-9
+        lists = self.tree.query_ball_point(queries.data[:, :3], radius, return_sorted=True)
+        counts = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        rows = np.repeat(np.arange(len(queries)), counts)
+        cols = np.fromiter(itertools.chain.from_iterable(lists), dtype=np.int64, count=counts.sum())
+        return rows, cols
+
+    def _score(self, queries, rows, cols):
+        return geometry.metric(geometry.SE3.from_data(queries.data[rows], single=False),
+                               geometry.SE3.from_data(self.poses.data[cols], single=False), self.w)
+
+    def nearest(self, queries, k=1, seeds=16, block_size=4096):
+        """
+        Finds the k nearest indexed poses to each query pose, the same result
+        as geometry.nearest_poses(queries, poses, w, k). The metric distances
+        of the `seeds` nearest positions bound the distance of the k-th
+        nearest pose, and the ball of that radius is re-scored. Queries are
+        processed block_size at a time to bound memory.
+        Args:
+            queries (SE3) : set of N query poses
+            k (int) : number of nearest poses, at most len(self)
+        Returns:
+            (N x k) indices into the indexed poses and (N x k) distances, nearest first
+        """
+        k = min(k, len(self))
+        n_seeds = min(max(k, seeds), len(self))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k))
+        if k == 0:
+            return indices, distances
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            _, seeds = self.tree.query(block.data[:, :3], k=list(range(1, n_seeds + 1)))
+            rows = np.repeat(np.arange(len(block)), n_seeds)
+            seed_dist = self._score(block, rows, seeds.ravel()).reshape(-1, n_seeds)
+            bound = np.partition(seed_dist, k - 1, axis=1)[:, k - 1]
+            rows, cols = self._ball(block, bound)
+            dist = self._score(block, rows, cols)
+            # order candidates by row, then distance, ties by index as np.argmin, and keep the first k of each row
+            order = np.lexsort((cols, dist, rows))
+            first = np.searchsorted(rows, np.arange(len(block)))
+            take = order[(first[:, None] + np.arange(k)).ravel()]
+            indices[start:start + len(block)] = cols[take].reshape(-1, k)
+            distances[start:start + len(block)] = dist[take].reshape(-1, k)
+        return indices, distances
+
+    def within(self, queries, radius, max_angle=None):
+        """
+        Finds all indexed poses within metric distance `radius` of each query
+        pose. If max_angle (rad) is given, `radius` is a tolerance on
+        translation (m) alone and poses must also be within max_angle of
+        rotation, e.g. within(queries, 5, np.radians(15)).
+        Args:
+            queries (SE3) : set of N query poses
+            radius (float or N array) : distance tolerance
+            max_angle (float or N array) : rotation tolerance
+        Returns:
+            offsets (N + 1), indices and distances of the matches, the matches of
+            query i being indices[offsets[i]:offsets[i + 1]], ordered by index.
+            Distances are metric distances, or (translation, rotation) pairs if
+            max_angle is given
+        """
+        if len(self) == 0:
+            shape = (0,) if max_angle is None else (0, 2)
+            return np.zeros(len(queries) + 1, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(shape)
+        rows, cols = self._ball(queries, radius)
+        if max_angle is None:
+            dist = self._score(queries, rows, cols)
+            keep = dist <= np.broadcast_to(radius, (len(queries),))[rows]
+        else:
+            t_dist = np.linalg.norm(queries.data[rows, :3] - self.poses.data[cols, :3], axis=-1)
+            R_dist = geometry._quat_distance(queries.data[rows, 3:], self.poses.data[cols, 3:])
+            dist = np.stack((t_dist, R_dist), axis=-1)
+            keep = (t_dist <= np.broadcast_to(radius, (len(queries),))[rows]) & \
+                   (R_dist <= np.broadcast_to(max_angle, (len(queries),))[rows])
+        offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=len(queries)), out=offsets[1:])
+        return offsets, cols[keep], dist[keep]
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+
+from src.util import camera_poses, geometry
+from src.thirdparty.robotcar_dataset_sdk.python.transform import build_se3_transform
+
+
+def test_binary_and_csv_poses_agree(tmp_path):
+    rng = np.random.default_rng(0)
+    xyzrpy = np.hstack((rng.normal(0, 100, (10, 3)), rng.normal(0, 0.5, (10, 3))))
+    poses = np.array([np.asarray(build_se3_transform(row)) for row in xyzrpy])
+    tstamps = 1000 + np.arange(10)
+    camera_poses.save_camera_poses(str(tmp_path), tstamps, poses)
+
+    binary_tstamps, binary = camera_poses.load_poses(str(tmp_path))
+    binary_df = camera_poses.load_camera_poses(str(tmp_path))
+    os.remove(os.path.join(str(tmp_path), camera_poses.BINARY_NAME))
+    csv_tstamps, csv = camera_poses.load_poses(str(tmp_path))
+    csv_df = camera_poses.load_camera_poses(str(tmp_path))
+
+    np.testing.assert_array_equal(binary_tstamps, tstamps)
+    np.testing.assert_array_equal(csv_tstamps, tstamps)
+    np.testing.assert_allclose(binary.data[:, :3], poses[:, :3, 3])
+    np.testing.assert_allclose(geometry.metric(binary, csv, 10), 0, atol=1e-6)
+    assert list(binary_df.columns) == list(csv_df.columns)
+    np.testing.assert_allclose(binary_df.to_numpy(), csv_df.to_numpy(), atol=1e-6)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from src.util import geometry
+from src.image_retrieval import evaluate
+
+
+def test_recall_with_n_above_k():
+    positives = csr_matrix(np.eye(3, dtype=bool))
+    predictions = np.array([[0, 1], [2, 1], [0, 2]])
+    for ns in [(5, 10), (1, 2, 5)]:
+        with pytest.raises(ValueError, match="got 2"):
+            evaluate.evaluate(predictions, positives, ns=ns)
+    assert evaluate.evaluate(predictions, positives, ns=(1, 2))["recall"] == {1: 1 / 3, 2: 1.0}
+
+
+def test_localisation_error_without_prediction():
+    poses = geometry.SE3.from_xyzrpy(np.random.default_rng(0).normal(size=(3, 6)))
+    predictions = np.array([[0, 1], [-1, -1], [1, 2]])
+    t_err, R_err = evaluate.localisation_error(poses, poses, predictions)
+    assert np.isnan(t_err[1]) and np.isnan(R_err[1])
+    assert t_err[0] == 0 and R_err[0] == 0
+    np.testing.assert_allclose(t_err[2], np.linalg.norm(poses.data[2, :3] - poses.data[1, :3]))
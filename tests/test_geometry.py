@@ -0,0 +1,70 @@
+import pickle
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from src.util import geometry
+
+
+class LegacySE3:
+    """
+    State of the SE3 class before poses were stored as one (N x 7) array, a
+    translation array and a Rotation, as held by existing SE3 pickles.
+    """
+
+    def __init__(self, t, R, single):
+        self._single = single
+        self._t = t
+        self._R = R
+        self.len = len(t)
+
+
+# pickled under the name of the previous class, src.util.geometry.SE3
+LegacySE3.__module__ = "src.util.geometry"
+LegacySE3.__qualname__ = "SE3"
+
+
+def legacy_pickle(legacy, protocol):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(geometry, "SE3", LegacySE3)
+        return pickle.dumps(legacy, protocol=protocol)
+
+
+@pytest.mark.parametrize("protocol", [0, 2, pickle.HIGHEST_PROTOCOL])
+@pytest.mark.parametrize("n", [1, 5])
+def test_load_legacy_pickle(protocol, n):
+    xyzrpy = np.random.default_rng(0).normal(size=(n, 6))
+    R = Rotation.from_euler("ZYX", xyzrpy[:, 3:])
+    data = legacy_pickle(LegacySE3(xyzrpy[:, :3], R, n == 1), protocol)
+
+    pose = pickle.loads(data)
+    expected = geometry.SE3.from_xyzrpy(xyzrpy)
+    assert isinstance(pose, geometry.SE3)
+    assert len(pose) == n
+    assert pose._single == (n == 1)
+    np.testing.assert_array_equal(pose.data, expected.data)
+    np.testing.assert_allclose(geometry.metric(pose, expected, 10), 0, atol=1e-12)
+
+
+def test_pickle_round_trip():
+    pose = geometry.SE3.from_xyzrpy(np.random.default_rng(1).normal(size=(3, 6)))
+    loaded = pickle.loads(pickle.dumps(pose))
+    np.testing.assert_array_equal(loaded.data, pose.data)
+    assert loaded._single == pose._single
+
+
+def test_single_pose_scalars():
+    poses = geometry.SE3.from_xyzrpy(np.random.default_rng(2).normal(size=(4, 6)))
+    assert np.ndim(geometry.metric(poses[0], poses[1], 10)) == 0
+    assert geometry.metric(poses[0], poses[1:], 10).shape == (3,)
+    assert all(np.ndim(x) == 0 for x in poses[0].magnitude())
+    assert all(x.shape == (4,) for x in poses.magnitude())
+    assert all(np.ndim(x) == 0 for x in geometry.error(poses[0], poses[1]))
+
+
+def test_keyframe_indices_empty():
+    poses = geometry.SE3.empty(0)
+    indices = geometry.keyframe_indices(poses, 10, 1)
+    assert len(indices) == 0
+    assert len(poses[indices]) == 0
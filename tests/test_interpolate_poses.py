@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation, Slerp
+
+from src.thirdparty.robotcar_dataset_sdk.python.interpolate_poses import interpolate_vo_poses, interpolate_ins_poses, \
+    interpolate_ins_poses_array
+from src.thirdparty.robotcar_dataset_sdk.python.transform import build_se3_transform
+
+
+@pytest.fixture
+def vo_log(tmp_path):
+    # 50 relative poses at timestamps 1000, 1100, ..., 5900
+    rng = np.random.default_rng(0)
+    timestamps = 1000 + 100 * np.arange(50)
+    xyzrpy = np.hstack((rng.normal(0, 1, (50, 3)), rng.normal(0, 0.05, (50, 3))))
+    path = tmp_path / "vo.csv"
+    with open(path, "w") as f:
+        f.write("source_timestamp,destination_timestamp,x,y,z,roll,pitch,yaw\n")
+        for timestamp, row in zip(timestamps, xyzrpy):
+            f.write("{},{},{}\n".format(timestamp, timestamp - 100, ",".join("%.17g" % v for v in row)))
+    return str(path), timestamps, xyzrpy
+
+
+def reference_vo_poses(timestamps, xyzrpy, pose_timestamps, origin_timestamp):
+    # poses accumulated one row at a time over the whole log from an identity pose at timestamp 0, interpolated
+    # linearly in position and by scipy's Slerp in rotation, and held constant after the last row
+    abs_poses = [np.identity(4)]
+    for row in xyzrpy:
+        abs_poses.append(abs_poses[-1] @ np.asarray(build_se3_transform(row)))
+    abs_poses = np.array(abs_poses)
+    log_timestamps = np.concatenate(([0], timestamps))
+    slerp = Slerp(log_timestamps, Rotation.from_matrix(abs_poses[:, :3, :3]))
+
+    def pose_at(t):
+        t = min(t, log_timestamps[-1])
+        pose = np.identity(4)
+        pose[:3, :3] = slerp([t]).as_matrix()[0]
+        for axis in range(3):
+            pose[axis, 3] = np.interp(t, log_timestamps, abs_poses[:, axis, 3])
+        return pose
+
+    origin = pose_at(origin_timestamp)
+    return np.array([np.linalg.inv(origin) @ pose_at(t) for t in pose_timestamps])
+
+
+@pytest.mark.parametrize("pose_timestamps, origin_timestamp", [
+    ([100, 500, 900], 300),      # window before the first row
+    ([6500, 7000], 6000),        # window after the last row
+    ([5500, 5950, 7000], 5000),  # window running past the last row
+    ([3000, 3100, 3200], 1500),  # origin before the requested timestamps
+    ([2000, 2500], 5900),        # origin after the requested timestamps, on the last row
+])
+def test_interpolate_vo_poses_window(vo_log, pose_timestamps, origin_timestamp):
+    path, timestamps, xyzrpy = vo_log
+    poses = interpolate_vo_poses(path, pose_timestamps, origin_timestamp)
+    expected = reference_vo_poses(timestamps, xyzrpy, pose_timestamps, origin_timestamp)
+    assert poses.shape == (len(pose_timestamps), 4, 4)
+    np.testing.assert_allclose(poses, expected, atol=1e-9)
+
+
+def test_interpolate_ins_poses_agree(tmp_path):
+    # the list-based and vectorised INS entry points interpolate between rows alike
+    rng = np.random.default_rng(1)
+    timestamps = 1000 + 100 * np.arange(20)
+    xyz = np.cumsum(rng.normal(0, 1, (20, 3)), axis=0)
+    rpy = rng.normal(0, 0.3, (20, 3))
+    path = tmp_path / "ins.csv"
+    with open(path, "w") as f:
+        f.write("timestamp,ins_status,latitude,longitude,altitude,northing,easting,down,utm_zone,"
+                "velocity_north,velocity_east,velocity_down,roll,pitch,yaw\n")
+        for timestamp, p, r in zip(timestamps, xyz, rpy):
+            f.write("{},INS_SOLUTION_GOOD,0,0,0,{},30U,0,0,0,{}\n".format(
+                timestamp, ",".join("%.17g" % v for v in p), ",".join("%.17g" % v for v in r)))
+    pose_timestamps = [1000, 1050, 1234, 1900, 2399, 2500]
+    poses = np.array([np.asarray(pose) for pose in interpolate_ins_poses(str(path), pose_timestamps)])
+    np.testing.assert_allclose(poses, interpolate_ins_poses_array(str(path), pose_timestamps), atol=1e-9)
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+
+from src.util.geometry import SE3
+from src.util.pose_db import PoseDatabase
+
+
+def random_poses(seed, n=5):
+    return SE3.from_xyzrpy(np.random.default_rng(seed).normal(size=(n, 6)))
+
+
+def test_add_from_stale_handles(tmp_path):
+    # two handles opened before either adds, as in two processes filling the same database
+    first = PoseDatabase(str(tmp_path))
+    second = PoseDatabase(str(tmp_path))
+    first.add("a", "stereo/left", np.arange(5), random_poses(0))
+    second.add("b", "stereo/left", np.arange(5), random_poses(1))
+    first.add("c", "stereo/left", np.arange(5), random_poses(2))
+
+    db = PoseDatabase(str(tmp_path))
+    assert [segment["traverse"] for segment in db.segments] == ["a", "b", "c"]
+    np.testing.assert_array_equal(db.poses(db.segment_id("b", "stereo/left")).data, random_poses(1).data)
+    assert not [fname for fname in os.listdir(str(tmp_path)) if fname.endswith(".tmp")]
+
+
+def test_overwrite_from_stale_handle(tmp_path):
+    first = PoseDatabase(str(tmp_path))
+    second = PoseDatabase(str(tmp_path))
+    first.add("a", "stereo/left", np.arange(5), random_poses(0))
+    np.testing.assert_array_equal(first.poses(0).data, random_poses(0).data)
+    second.add("a", "stereo/left", np.arange(3), random_poses(1, 3), overwrite=True)
+    first.add("b", "stereo/left", np.arange(5), random_poses(2))
+
+    assert len(first) == 8
+    np.testing.assert_array_equal(first.poses(0).data, random_poses(1, 3).data)
@@ -0,0 +1,16 @@
+import numpy as np
+
+from src.util import geometry
+from src.util.pose_index import PoseIndex
+
+
+def test_empty_index():
+    queries = geometry.SE3.from_xyzrpy(np.random.default_rng(0).normal(size=(4, 6)))
+    index = PoseIndex(geometry.SE3.empty(0), 10)
+    indices, distances = index.nearest(queries, k=3)
+    assert indices.shape == (4, 0) and distances.shape == (4, 0)
+    offsets, indices, distances = index.within(queries, 5)
+    np.testing.assert_array_equal(offsets, np.zeros(5))
+    assert indices.shape == (0,) and distances.shape == (0,)
+    offsets, indices, distances = index.within(queries, 5, np.radians(15))
+    assert indices.shape == (0,) and distances.shape == (0, 2)
@@ -0,0 +1,21 @@
+import pytest
+
+from src.process_raw.ready_images import parse_size
+
+
+def test_parse_size():
+    assert parse_size("1/2") == (0.5, None)
+    assert parse_size("w320", 1280) == (None, 320)
+    assert parse_size("w1280", 1280) == (None, 1280)
+
+
+@pytest.mark.parametrize("spec", ["2", "0/1", "w0", "w-5", "w2000"])
+def test_parse_size_must_downsample(spec):
+    with pytest.raises(ValueError, match="must downsample"):
+        parse_size(spec, 1280)
+
+
+@pytest.mark.parametrize("spec", ["wabc", "a/b", "1/0", ""])
+def test_parse_size_invalid(spec):
+    with pytest.raises(ValueError, match="Invalid resized variant"):
+        parse_size(spec)